@@ -0,0 +1,209 @@
+# TeamWork leads/dedup.py
+import re
+import zlib
+from collections import defaultdict
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+
+NUM_PERM = 32            # MinHash permutations per string
+MINHASH_PRIME = (1 << 31) - 1
+GEOHASH_PRECISION = 7    # ~150m x 150m cells
+MAX_BLOCK_SIZE = 200     # Bigger phone/domain/name blocks (a chain's head office, say) say nothing about duplicates
+MAX_CELL_SIZE = 1000     # Leads in one geohash cell; only the very densest downtown blocks go past this
+MAX_DISTANCE = 500       # meters; further apart than this is a different branch, whatever the name
+DUPLICATE_SCORE = 0.6
+# Weights of the per-field similarities in a pair's score
+WEIGHTS = {"name": 0.45, "address": 0.2, "phone": 0.2, "domain": 0.15}
+
+NAME_STOPWORDS = {"the", "inc", "llc", "ltd", "co", "corp", "company", "and", "of"}
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "boulevard": "blvd", "lane": "ln",
+    "court": "ct", "place": "pl", "highway": "hwy", "suite": "ste", "north": "n", "south": "s",
+    "east": "e", "west": "w",
+}
+# Sites that host many businesses' pages, so sharing one says nothing
+SHARED_DOMAINS = {"facebook.com", "instagram.com", "yelp.com", "google.com", "business.site", "linktr.ee",
+                  "wixsite.com", "square.site", "godaddysites.com", "sites.google.com"}
+WORD_RE = re.compile(r"[a-z0-9]+")
+EARTH_RADIUS = 6371000
+
+def normalize_name(name):
+    words = WORD_RE.findall(str(name).lower().replace("&", " and "))
+    return " ".join(word for word in words if word not in NAME_STOPWORDS)
+
+def normalize_address(address):
+    words = WORD_RE.findall(str(address).lower())
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", str(phone))
+    return digits[-10:] if len(digits) >= 7 else ""
+
+def website_domain(website):
+    website = str(website).strip().lower()
+    if not website:
+        return ""
+    host = urlparse(website if "//" in website else "//" + website).netloc.removeprefix("www.")
+    return "" if host in SHARED_DOMAINS or any(host.endswith("." + shared) for shared in SHARED_DOMAINS) else host
+
+def geohash_cells(lats, lngs, precision=GEOHASH_PRECISION):
+    """Each point's geohash cell as one integer: the cell's row and column, whose bits a geohash interleaves."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    rows = np.floor((lats + 90) / 180 * 2 ** lat_bits).astype(np.int64)
+    columns = np.floor((lngs + 180) / 360 * 2 ** lng_bits).astype(np.int64)
+    return rows << lng_bits | columns, lng_bits
+
+def minhash(texts, num_perm=NUM_PERM, seed=0):
+    """MinHash signatures of each text's character trigrams, one row per text.
+
+    Matching positions between two rows estimate the Jaccard similarity of their trigram sets.
+    Empty texts get an all-zero row, which similarity() treats as unknown.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    signatures = np.zeros((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), 20000):
+        chunk = texts[start:start + 20000]
+        grams = [{text[i:i + 3] for i in range(max(1, len(text) - 2))} if text else set() for text in chunk]
+        lengths = np.array([len(text_grams) for text_grams in grams])
+        if not lengths.any():
+            continue
+        hashes = np.fromiter((zlib.crc32(gram.encode()) for text_grams in grams for gram in text_grams),
+                             dtype=np.uint64, count=int(lengths.sum()))
+        permuted = (hashes[:, None] * a + b) % MINHASH_PRIME + 1
+        filled = np.flatnonzero(lengths)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])[filled]
+        signatures[start + filled] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+def similarity(signatures, left, right):
+    """Estimated Jaccard similarity for each (left[k], right[k]) pair; 0 where either side is empty."""
+    matches = (signatures[left] == signatures[right]).mean(axis=1)
+    empty = (signatures[left, 0] == 0) | (signatures[right, 0] == 0)
+    return np.where(empty, 0.0, matches)
+
+def distance(lat1, lng1, lat2, lng2):
+    # Vectorised haversine distance in meters
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+def pairs_sharing(rows, keys, max_size, other_keys=None):
+    """(i, j) row pairs, i < j, whose keys match (rows' keys against other_keys, if given).
+
+    Keys held by more than max_size rows are skipped: a block that big says nothing.
+    """
+    frame = pd.DataFrame({"row": rows, "key": keys})
+    frame = frame[frame["key"].map(frame["key"].value_counts()) <= max_size]
+    other = frame if other_keys is None else pd.DataFrame({"row": rows, "key": other_keys})
+    pairs = frame.merge(other, on="key")
+    pairs = pairs[pairs["row_x"] < pairs["row_y"]]
+    return pairs["row_x"].to_numpy(), pairs["row_y"].to_numpy()
+
+def candidate_pairs(names, phones, domains, lats, lngs):
+    """Unique (i, j), i < j, of rows that could be the same business: in the same or a neighbouring
+    geohash cell, or sharing a phone, website domain or normalized name. Joins on the block keys
+    keep this close to linear; nothing is ever compared against every other lead."""
+    left, right = [], []
+    located = np.flatnonzero(~np.isnan(lats) & ~np.isnan(lngs))
+    if len(located):
+        cells, lng_bits = geohash_cells(lats[located], lngs[located])
+        # Pair each cell with itself and its eight neighbours so duplicates across a cell edge still meet
+        for row_offset in (-1, 0, 1):
+            for column_offset in (-1, 0, 1):
+                shifted = cells + (row_offset << lng_bits) + column_offset
+                pair_left, pair_right = pairs_sharing(located, cells, MAX_CELL_SIZE, other_keys=shifted)
+                left.append(pair_left)
+                right.append(pair_right)
+    all_rows = np.arange(len(names))
+    for keys in (names, phones, domains):
+        keys = np.asarray(keys, dtype=object)
+        present = keys != ""
+        pair_left, pair_right = pairs_sharing(all_rows[present], keys[present], MAX_BLOCK_SIZE)
+        left.append(pair_left)
+        right.append(pair_right)
+    left, right = np.concatenate(left), np.concatenate(right)
+    if not len(left):
+        return left, right
+    pairs = np.unique(np.stack([left, right], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+def find_duplicates(data):
+    """Likely duplicate pairs among leads (a frame as returned by lead_store.load_leads).
+
+    Returns a frame of (left, right) row positions and lead keys with the pair's score and
+    per-field similarities, best matches first.
+    """
+    names = [normalize_name(name) for name in data["Name"]]
+    addresses = [normalize_address(address) for address in data["Address"]]
+    phones = np.array([normalize_phone(phone) for phone in data["Phone Number"]], dtype=object)
+    domains = np.array([website_domain(website) for website in data["Website"]], dtype=object)
+    lats = data["Latitude"].to_numpy(dtype=float, na_value=np.nan)
+    lngs = data["Longitude"].to_numpy(dtype=float, na_value=np.nan)
+
+    left, right = candidate_pairs(names, phones, domains, lats, lngs)
+    if not len(left):
+        return pd.DataFrame(columns=["left", "right", "left_key", "right_key", "score", "name", "address", "phone", "domain", "meters"])
+
+    # Only strings that are in some candidate pair need signatures
+    rows = np.unique(np.concatenate([left, right]))
+    position = np.full(len(data), -1)
+    position[rows] = np.arange(len(rows))
+    name_signatures = minhash([names[row] for row in rows])
+    address_signatures = minhash([addresses[row] for row in rows])
+
+    scores = {
+        "name": similarity(name_signatures, position[left], position[right]),
+        "address": similarity(address_signatures, position[left], position[right]),
+        "phone": ((phones[left] == phones[right]) & (phones[left] != "")).astype(float),
+        "domain": ((domains[left] == domains[right]) & (domains[left] != "")).astype(float),
+    }
+    score = sum(WEIGHTS[field] * values for field, values in scores.items())
+    meters = distance(lats[left], lngs[left], lats[right], lngs[right])
+    duplicate = (score >= DUPLICATE_SCORE) & ~(meters > MAX_DISTANCE)
+
+    keys = data["Lead Key"].to_numpy(dtype=object)
+    pairs = pd.DataFrame({
+        "left": left[duplicate],
+        "right": right[duplicate],
+        "left_key": keys[left[duplicate]],
+        "right_key": keys[right[duplicate]],
+        "score": score[duplicate].round(3),
+        **{field: values[duplicate].round(3) for field, values in scores.items()},
+        "meters": np.round(meters[duplicate]),
+    })
+    return pairs.sort_values("score", ascending=False, ignore_index=True)
+
+def group_duplicates(data, pairs):
+    """Cluster duplicate pairs (union-find) and pick a survivor per cluster: the most complete
+    lead, then the oldest. Returns [(survivor key, [merged keys])]."""
+    parent = {}
+
+    def find(row):
+        parent.setdefault(row, row)
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for left, right in zip(pairs["left"], pairs["right"]):
+        root_left, root_right = find(left), find(right)
+        if root_left != root_right:
+            parent[max(root_left, root_right)] = min(root_left, root_right)
+
+    clusters = defaultdict(list)
+    for row in parent:
+        clusters[find(row)].append(row)
+
+    filled = data[["Website", "Email", "Phone Number", "Rating", "Place ID", "Latitude"]].notna() & \
+        data[["Website", "Email", "Phone Number", "Rating", "Place ID", "Latitude"]].ne("")
+    completeness = filled.sum(axis=1).to_numpy()
+    keys = data["Lead Key"].to_numpy(dtype=object)
+    groups = []
+    for rows in clusters.values():
+        rows = sorted(rows, key=lambda row: (-completeness[row], row))
+        groups.append((keys[rows[0]], [keys[row] for row in rows[1:]]))
+    return groups
@@ -0,0 +1,138 @@
+# TeamWork leads/email_crawler.py
+import re
+import threading
+from urllib.parse import urljoin, urlparse, unquote
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+from lxml import etree
+
+MAX_PAGE_BYTES = 512 * 1024  # Stop reading a page past this size
+MAX_EXTRA_PAGES = 3          # Contact/about pages visited after the homepage
+REQUEST_TIMEOUT = (5, 15)    # (connect, read) seconds
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; TeamWorkLeadBot/1.0)"}
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+# "name [at] domain [dot] com", "name(at)domain.com", "name {at} domain dot com". Only a bracketed
+# "at" counts, and a bare "." only with no space around it, so prose like "by at Joes. Best" isn't one.
+OBFUSCATED_EMAIL_RE = re.compile(
+    r"([A-Za-z0-9._%+-]+)\s*(?:\[at\]|\(at\)|\{at\})\s*([A-Za-z0-9-]+(?:(?:\s*(?:\[dot\]|\(dot\)|\{dot\})\s*|\s+dot\s+|\.)[A-Za-z0-9-]+)+)",
+    re.IGNORECASE,
+)
+DOT_RE = re.compile(r"\s*(?:\[dot\]|\(dot\)|\{dot\})\s*|\s+dot\s+", re.IGNORECASE)
+CONTACT_LINK_RE = re.compile(r"contact|about|team|staff|impressum|reach|location", re.IGNORECASE)
+# Things that look like addresses but are asset names, e.g. logo@2x.png
+ASSET_SUFFIX_RE = re.compile(r"\.(?:png|jpe?g|gif|svg|webp|css|js)$", re.IGNORECASE)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """One pooled session shared by every crawl so connections are reused across leads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=1)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update(HEADERS)
+        return _session
+
+def fetch_page(url, max_bytes=MAX_PAGE_BYTES):
+    """Return (final_url, body bytes) for an HTML page, reading at most max_bytes."""
+    with get_session().get(url, stream=True, timeout=REQUEST_TIMEOUT, allow_redirects=True) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and "html" not in content_type:
+            return response.url, b""
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=16 * 1024):
+            body.extend(chunk)
+            if len(body) >= max_bytes:
+                break
+        return response.url, bytes(body[:max_bytes])
+
+def decode_cfemail(encoded):
+    # Cloudflare's email protection XORs every byte with the first one
+    key = int(encoded[:2], 16)
+    return "".join(chr(int(encoded[i:i + 2], 16) ^ key) for i in range(2, len(encoded), 2))
+
+def is_email(candidate):
+    return bool(EMAIL_RE.fullmatch(candidate)) and not ASSET_SUFFIX_RE.search(candidate)
+
+def extract_emails(text):
+    emails = [email for email in EMAIL_RE.findall(text) if is_email(email)]
+    for user, domain in OBFUSCATED_EMAIL_RE.findall(text):
+        email = f"{user}@{DOT_RE.sub('.', domain)}"
+        if is_email(email):
+            emails.append(email)
+    return emails
+
+def parse_page(base_url, body):
+    """Return (emails, candidate contact page urls) found in an HTML page."""
+    if not body:
+        return [], []
+    try:
+        tree = lxml_html.fromstring(body)
+    except (etree.ParserError, ValueError):
+        return extract_emails(body.decode("utf-8", "ignore")), []
+
+    emails = []
+    links = []
+    for anchor in tree.iter("a"):
+        href = (anchor.get("href") or "").strip()
+        if href.lower().startswith("mailto:"):
+            email = unquote(href[7:].split("?")[0]).strip()
+            if is_email(email):
+                emails.append(email)
+        elif href and CONTACT_LINK_RE.search(href + " " + (anchor.text or "")):
+            links.append(urljoin(base_url, href))
+    for element in tree.xpath("//*[@data-cfemail]"):
+        try:
+            emails.append(decode_cfemail(element.get("data-cfemail")))
+        except ValueError:
+            pass
+    for bad in tree.xpath("//script|//style"):
+        bad.drop_tree()
+    # Text nodes joined with a space: text_content() glues "a@b.com</p><p>Call" into one address
+    emails.extend(extract_emails(" ".join(tree.itertext())))
+    return emails, links
+
+def same_site(url, root_url):
+    host = urlparse(url).netloc.lower().removeprefix("www.")
+    return host == urlparse(root_url).netloc.lower().removeprefix("www.")
+
+def pick_email(emails, website):
+    # Prefer an address on the business's own domain over a web designer's or a platform's
+    domain = urlparse(website).netloc.lower().removeprefix("www.")
+    for email in emails:
+        if email.lower().endswith("@" + domain):
+            return email
+    return emails[0] if emails else ""
+
+def crawl_for_email(website, fetch=fetch_page, max_extra_pages=MAX_EXTRA_PAGES):
+    """Look for an email on a business's homepage, then on a few likely contact/about pages."""
+    final_url, body = fetch(website)
+    emails, links = parse_page(final_url, body)
+    if emails:
+        return pick_email(emails, final_url)
+
+    visited = {final_url.rstrip("/"), website.rstrip("/")}
+    for link in links:
+        if max_extra_pages <= 0:
+            break
+        link = link.split("#")[0]
+        if link.rstrip("/") in visited or not link.startswith("http") or not same_site(link, final_url):
+            continue
+        visited.add(link.rstrip("/"))
+        max_extra_pages -= 1
+        try:
+            page_url, body = fetch(link)
+        except requests.exceptions.RequestException:
+            continue
+        emails, _ = parse_page(page_url, body)
+        if emails:
+            return pick_email(emails, final_url)
+    return ""
@@ -0,0 +1,92 @@
+# TeamWork leads/http_cache.py
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from lru_store import LruStore
+
+CACHE_DB = os.environ.get("HTTP_CACHE_DB", os.path.join(os.path.dirname(__file__), "data/http_cache.db"))
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # Least recently used responses are evicted past this size
+
+# Seconds each kind of response stays fresh
+CACHE_TTLS = {
+    "nearbysearch": 24 * 3600,
+    "findplacefromtext": 30 * 24 * 3600,
+    "details": 30 * 24 * 3600,
+    "customsearch": 7 * 24 * 3600,
+    "nominatim": 90 * 24 * 3600,
+    "ip_geocode": 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+# Request parameters that don't change the response and must never be stored
+IGNORED_PARAMS = ("key",)
+
+class HttpCache:
+    def __init__(self, db_path=CACHE_DB, ttls=None, max_bytes=CACHE_MAX_BYTES):
+        self.store = LruStore(db_path, max_bytes, label_column="endpoint")
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def make_key(self, endpoint, params):
+        params = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+        raw = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, key):
+        return self.store.get(key, max_age=self.ttls.get(endpoint, DEFAULT_TTL))
+
+    def set(self, endpoint, key, value):
+        self.store.set(key, endpoint, value)
+
+    def clear(self):
+        self.store.clear()
+        self.hits = self.misses = 0
+
+    def fetch(self, endpoint, params, fetcher, cacheable=lambda data: True):
+        """Return the cached response for (endpoint, params), calling fetcher() on a miss.
+
+        Concurrent misses for the same request wait on the first caller instead of
+        sending duplicate requests.
+        """
+        key = self.make_key(endpoint, params)
+        cached = self.get(endpoint, key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                # A leader may have stored it and left between our lookup and taking the lock
+                cached = self.get(endpoint, key)
+                if cached is not None:
+                    self.hits += 1
+                    return cached
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            data = fetcher()
+            if cacheable(data):
+                self.set(endpoint, key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
@@ -0,0 +1,63 @@
+# TeamWork leads/lead_analytics.py
+# Aggregates behind the lead analytics panel; every view is a groupby over the whole store
+import numpy as np
+import pandas as pd
+
+RATING_BINS = np.arange(1.0, 5.01, 0.5)  # Google ratings run from 1 to 5
+CONTACT_COLUMNS = {"Email": "Email", "Phone": "Phone Number", "Website": "Website"}
+
+def keyword_distribution(data):
+    """Leads per keyword, most first."""
+    counts = data.groupby("Keyword", observed=True).size()
+    return counts.sort_values(ascending=False).rename("Leads").reset_index()
+
+def rating_histogram(data):
+    """Leads per half-star rating bin, one column per keyword plus "All". Unrated leads are left out."""
+    rated = data[data["Rating"].notna()]
+    bins = pd.cut(rated["Rating"], RATING_BINS, include_lowest=True,
+                  labels=[f"{low:.1f}–{high:.1f}" for low, high in zip(RATING_BINS[:-1], RATING_BINS[1:])])
+    histogram = pd.crosstab(bins, rated["Keyword"]).reindex(bins.cat.categories, fill_value=0)
+    histogram.insert(0, "All", histogram.sum(axis=1))
+    histogram.index.name = "Rating"
+    histogram.columns.name = None
+    return histogram
+
+def contact_coverage(data):
+    """Share of each keyword's leads (and of all leads) with an email, phone number and website, in percent."""
+    filled = pd.DataFrame({
+        label: data[column].fillna("").astype(str).str.strip().ne("").to_numpy()
+        for label, column in CONTACT_COLUMNS.items()
+    })
+    filled["Keyword"] = data["Keyword"].to_numpy()
+    coverage = filled.groupby("Keyword", observed=True).mean()
+    coverage.loc["All"] = filled[list(CONTACT_COLUMNS)].mean()
+    coverage.insert(0, "Leads", filled.groupby("Keyword", observed=True).size().reindex(coverage.index, fill_value=len(filled)))
+    coverage[list(CONTACT_COLUMNS)] = (coverage[list(CONTACT_COLUMNS)] * 100).round(1)
+    return coverage.reset_index()
+
+def api_yield(coverage, api_calls):
+    """Leads and leads with an email per Google request, per keyword, best first.
+
+    coverage is contact_coverage(); api_calls has Keyword and Requests columns. Keywords with
+    no recorded requests (leads from before this was tracked, or served from cache) show NaN.
+    """
+    per_keyword = coverage[coverage["Keyword"] != "All"].merge(api_calls, on="Keyword", how="left")
+    requests = per_keyword["Requests"].where(per_keyword["Requests"] > 0)
+    return pd.DataFrame({
+        "Keyword": per_keyword["Keyword"],
+        "Requests": per_keyword["Requests"].fillna(0).astype(int),
+        "Leads": per_keyword["Leads"],
+        "Leads per request": (per_keyword["Leads"] / requests).round(3),
+        "Emails per request": (per_keyword["Leads"] * per_keyword["Email"] / 100 / requests).round(3),
+    }).sort_values("Leads per request", ascending=False, na_position="last", ignore_index=True)
+
+def build_analytics(data, api_calls):
+    """Every analytics view, from lead_store.load_leads() and lead_jobs.api_calls_by_keyword()."""
+    data = data.assign(Keyword=data["Keyword"].astype("string").fillna(""))
+    coverage = contact_coverage(data)
+    return {
+        "keywords": keyword_distribution(data),
+        "ratings": rating_histogram(data),
+        "coverage": coverage,
+        "yield": api_yield(coverage, api_calls),
+    }
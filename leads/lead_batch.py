@@ -0,0 +1,178 @@
+# TeamWork leads/lead_batch.py
+# Headless lead generation for cron: python leads/lead_batch.py sweep.json --workers 4
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import lead_pipeline
+import lead_store
+from metrics import PipelineMetrics
+
+logger = logging.getLogger("lead_batch")
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "data/batch")
+
+# Job spec keys and their defaults; "cities" and "seeds" are required
+SPEC_DEFAULTS = {
+    "num_keywords": 1,        # Keyword variations per seed; 0 searches the seeds as they are
+    "model": lead_pipeline.KEYWORD_MODEL,
+    "radius": 50000,
+    "business_type": "",
+    "max_results": 20,
+    "tiled": False,
+    "refresh_after_days": lead_pipeline.REFRESH_AFTER_DAYS,
+}
+
+def load_spec(path):
+    """Read a job spec, e.g.
+    {"cities": ["Pittsburgh, PA", "40.17,-80.24"], "seeds": ["plumber"], "num_keywords": 3, "radius": 10000}
+    """
+    with open(path, 'r') as file:
+        spec = dict(SPEC_DEFAULTS, **json.load(file))
+    for key in ("cities", "seeds"):
+        if not spec.get(key):
+            raise ValueError(f"Job spec needs a non-empty '{key}' list")
+    return spec
+
+def resolve_city(city):
+    """Turn "City, State" or "lat,lng" into "lat,lng"; None if the city can't be geocoded."""
+    try:
+        latitude, longitude = map(float, city.split(","))
+        return f"{latitude},{longitude}"
+    except ValueError:
+        pass
+    name, _, state = city.rpartition(",")
+    latlng = lead_pipeline.geocode_city_state(name.strip(), state.strip()) if name else None
+    return f"{latlng[0]},{latlng[1]}" if latlng else None
+
+def expand_seed(seed, spec):
+    if spec["num_keywords"] <= 0:
+        return [seed]
+    keywords = lead_pipeline.generate_keywords(seed, spec["num_keywords"], model=spec["model"])
+    if not keywords:
+        logger.warning(f"No keywords generated for '{seed}'; searching the seed itself")
+        return [seed]
+    return keywords
+
+def plan_shards(spec):
+    """One shard per (city, seed). Geocoding and keyword generation happen once, here, so the
+    workers don't multiply Nominatim's one-request-per-second limit or the Ollama load."""
+    locations = {}
+    for city in spec["cities"]:
+        location = resolve_city(city)
+        if location:
+            locations[city] = location
+        else:
+            logger.warning(f"Couldn't geocode '{city}'; skipping it")
+    keywords = {seed: expand_seed(seed, spec) for seed in spec["seeds"]}
+    return [
+        {"city": city, "location": location, "seed": seed, "keywords": keywords[seed]}
+        for city, location in locations.items()
+        for seed in spec["seeds"]
+    ]
+
+def init_worker(workers):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    # Every worker shares the same API key, so each gets an equal slice of the quotas
+    lead_pipeline.RATE_LIMITERS = lead_pipeline.make_rate_limiters(share=1 / workers)
+
+def run_shard(shard, spec, api_key, cse_id):
+    started = time.time()
+    job_id, rows, counts, status, metrics = lead_pipeline.run_job(
+        shard["keywords"], shard["location"], api_key, cse_id, spec["business_type"], spec["radius"],
+        spec["max_results"], spec["refresh_after_days"], spec["tiled"],
+    )
+    sampler = metrics.resources
+    return dict(shard,
+                job_id=job_id,
+                status=status,
+                rows=rows,
+                enriched=len(rows),
+                skipped=sum(keyword_counts["skipped"] for keyword_counts in counts.values()),
+                seconds=round(time.time() - started, 1),
+                peak_cpu_percent=sampler.peak_cpu_percent,
+                peak_memory_percent=sampler.peak_memory_percent,
+                metrics=metrics.snapshot())
+
+def run_batch(spec, api_key, cse_id, workers, output_dir):
+    """Run every shard of a spec and write leads_<run>.csv and summary_<run>.json. Returns the summary."""
+    run_started = time.time()
+    shards = plan_shards(spec)
+    workers = max(1, min(workers, len(shards)))
+    logger.info(f"Running {len(shards)} shards on {workers} worker processes")
+
+    results = []
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workers,)) as pool:
+        futures = {pool.submit(run_shard, shard, spec, api_key, cse_id): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Shard {shard['city']} / {shard['seed']} failed: {e}")
+                failures.append(dict(shard, error=str(e)))
+                continue
+            logger.info(f"Shard {shard['city']} / {shard['seed']}: job {result['job_id']} {result['status']}, "
+                        f"{result['enriched']} enriched, {result['skipped']} already known in {result['seconds']}s")
+            results.append(result)
+
+    metrics = PipelineMetrics()
+    leads = []
+    for result in results:
+        metrics.merge(result.pop("metrics"))
+        leads.extend(row + [result["city"]] for row in result.pop("rows"))
+
+    seconds = time.time() - run_started
+    stages = metrics.summary()
+    requests_made = sum(stage["Requests"] for stage in stages if stage["Stage"] != "enrich")
+    summary = {
+        "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run_started)),
+        "seconds": round(seconds, 1),
+        "workers": workers,
+        "shards": len(shards),
+        "failed_shards": len(failures),
+        "enriched": len(leads),
+        "skipped": sum(result["skipped"] for result in results),
+        "leads_per_second": round(len(leads) / seconds, 2) if seconds else None,
+        "requests_per_lead": round(requests_made / len(leads), 2) if leads else None,
+        "stages": stages,
+        "shard_results": results + failures,
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(run_started))
+    pd.DataFrame(leads, columns=list(lead_store.LEAD_COLUMNS) + ["City"]).to_csv(
+        os.path.join(output_dir, f"leads_{stamp}.csv"), index=False)
+    with open(os.path.join(output_dir, f"summary_{stamp}.json"), 'w') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate leads for every city and seed keyword in a job spec.")
+    parser.add_argument("spec", help="JSON job spec with cities, seeds, radius and other search settings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"where results and the summary go (default: {OUTPUT_DIR})")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"), help="Google Maps API key (default: $GOOGLE_API_KEY, then config.json)")
+    parser.add_argument("--cse-id", default=os.environ.get("GOOGLE_CSE_ID"), help="Custom Search Engine ID (default: $GOOGLE_CSE_ID, then config.json)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    config = lead_pipeline.load_config()
+    api_key = args.api_key or config.get("API_KEY")
+    cse_id = args.cse_id or config.get("CSE_ID")
+    if not api_key or not cse_id:
+        parser.error("a Google API key and CSE ID are required (flags, environment or leads/config.json)")
+
+    summary = run_batch(load_spec(args.spec), api_key, cse_id, args.workers, args.output_dir)
+    print(pd.DataFrame(summary["stages"]).to_string(index=False))
+    print(f"{summary['enriched']} leads in {summary['seconds']}s ({summary['leads_per_second']} leads/s, "
+          f"{summary['requests_per_lead']} requests/lead), {summary['failed_shards']} failed shards")
+    return 1 if summary["failed_shards"] or any(result.get("status") != "done" for result in summary["shard_results"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# TeamWork leads/lead_benchmark.py
+# Offline throughput benchmarks of the lead pipeline against mock_google.py:
+#   python leads/lead_benchmark.py                       # every scenario
+#   python leads/lead_benchmark.py baseline flaky --baseline leads/data/benchmark/benchmark_<run>.json
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from mock_google import MockGoogleServer
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "data/benchmark")
+
+# run_job settings shared by every scenario
+RUN_DEFAULTS = {
+    "keywords": ["plumber", "bakery"],
+    "location": "40.4406,-79.9959",
+    "business_type": "",
+    "radius": 5000,
+    "max_results": 60,
+}
+
+# Mock server options and run_job overrides per scenario. A "warm" scenario runs twice against
+# the same store and HTTP cache and reports the second run, with every lead due for a refresh.
+SCENARIOS = {
+    "baseline": {},
+    "slow_network": {"mock": {"latency_scale": 3}},
+    "flaky": {"mock": {"error_rate": 0.1, "site_error_rate": 0.1}},
+    "warm_cache": {"warm": True, "run": {"refresh_after_days": 0}},
+}
+GOOGLE_ENDPOINTS = ("nearbysearch", "findplacefromtext", "details", "customsearch")
+
+def run_pass(settings, real_rate_limits):
+    """One run_job in this (fresh) process; returns its timings and per-stage metrics."""
+    # Imported here so the store, cache and API URLs come from the environment the parent set up
+    import lead_pipeline
+    if not real_rate_limits:
+        lead_pipeline.RATE_LIMITERS = {}
+    started = time.perf_counter()
+    job_id, rows, counts, status, metrics = lead_pipeline.run_job(
+        settings["keywords"], settings["location"], "mock-key", "mock-cse", settings["business_type"], settings["radius"],
+        settings["max_results"], settings.get("refresh_after_days", lead_pipeline.REFRESH_AFTER_DAYS),
+    )
+    return {
+        "seconds": time.perf_counter() - started,
+        "status": status,
+        "leads": len(rows),
+        "emails": {row[9]: row[4] for row in rows if row[4]},
+        "stages": metrics.summary(),
+    }
+
+def run_scenario(name, scenario, real_rate_limits=False):
+    """Run a scenario against its own mock server, store and HTTP cache. Returns its report."""
+    settings = dict(RUN_DEFAULTS, **scenario.get("run", {}))
+    with tempfile.TemporaryDirectory(prefix=f"lead-benchmark-{name}-") as scratch:
+        server = MockGoogleServer(**scenario.get("mock", {})).start()
+        environ = dict(server.environ(),
+                       LEADS_DB=os.path.join(scratch, "leads.db"),
+                       HTTP_CACHE_DB=os.path.join(scratch, "http_cache.db"))
+        saved = {key: os.environ.get(key) for key in environ}
+        os.environ.update(environ)
+        try:
+            for _ in range(2 if scenario.get("warm") else 1):
+                server.mock.requests.clear()
+                server.mock.errors.clear()
+                # A new process per pass: nothing in memory carries over, only what's on disk
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(run_pass, settings, real_rate_limits).result()
+            served = server.mock.summary()
+            # An email only counts if it's the one the fixture put on the site, not just something that parsed
+            found = result["emails"]
+            right_emails = sum(email.lower() == server.mock.places.get(place_id, {}).get("email", "").lower()
+                               for place_id, email in found.items())
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            server.stop()
+
+    leads = result["leads"]
+    google_requests = sum(served["requests"].get(endpoint, 0) for endpoint in GOOGLE_ENDPOINTS)
+    return {
+        "scenario": name,
+        "status": result["status"],
+        "seconds": round(result["seconds"], 2),
+        "leads": leads,
+        "leads_per_second": round(leads / result["seconds"], 2) if result["seconds"] else None,
+        "requests_per_lead": round(google_requests / leads, 2) if leads else None,
+        "site_pages_per_lead": round(served["requests"].get("site", 0) / leads, 2) if leads else None,
+        "email_rate": round(right_emails / leads, 2) if leads else None,
+        "wrong_emails": len(found) - right_emails,
+        "injected_errors": sum(served["errors"].values()),
+        "p95_ms": {stage["Stage"]: stage["p95 ms"] for stage in result["stages"]},
+        "served": served,
+        "stages": result["stages"],
+    }
+
+def report_table(reports, baseline=None):
+    table = pd.DataFrame([
+        {"Scenario": report["scenario"], "Status": report["status"], "Leads": report["leads"], "Seconds": report["seconds"],
+         "Leads/s": report["leads_per_second"], "Requests/lead": report["requests_per_lead"],
+         "Pages/lead": report["site_pages_per_lead"], "Email rate": report["email_rate"],
+         "Wrong emails": report.get("wrong_emails", 0),
+         "Injected errors": report["injected_errors"],
+         **{f"p95 {stage} ms": p95 for stage, p95 in report["p95_ms"].items()}}
+        for report in reports
+    ])
+    if baseline:
+        previous = {report["scenario"]: report for report in baseline["scenarios"]}
+        table["Leads/s vs baseline"] = [
+            f"{report['leads_per_second'] / previous[report['scenario']]['leads_per_second']:.2f}x"
+            if previous.get(report["scenario"], {}).get("leads_per_second") and report["leads_per_second"] else ""
+            for report in reports
+        ]
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the lead pipeline against a local mock of the Google APIs.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--real-rate-limits", action="store_true",
+                        help="keep the production Places/Custom Search rate limits instead of measuring the pipeline alone")
+    parser.add_argument("--baseline", help="an earlier benchmark JSON to compare leads/s against")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"where the JSON report goes (default: {OUTPUT_DIR})")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+    started = time.time()
+    reports = []
+    for name in args.scenarios or list(SCENARIOS):
+        print(f"Running {name}...", file=sys.stderr)
+        reports.append(run_scenario(name, SCENARIOS[name], args.real_rate_limits))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"benchmark_{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}.json")
+    with open(path, 'w') as file:
+        json.dump({"started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+                   "run": RUN_DEFAULTS, "real_rate_limits": args.real_rate_limits, "scenarios": reports}, file, indent=2)
+    print(report_table(reports, baseline).to_string(index=False))
+    print(f"Report written to {path}")
+    return 0 if all(report["status"] == "done" for report in reports) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
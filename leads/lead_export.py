@@ -0,0 +1,109 @@
+# TeamWork leads/lead_export.py
+# Lead exports, written chunk by chunk from SQLite and kept on disk per data version
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+import lead_store
+from lead_store import LEADS_DB
+
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), "data/exports")
+EXPORT_CHUNK_ROWS = 20000  # Leads read and written at a time; bounds memory whatever the store's size
+MAX_EXPORT_FILES = 8       # Least recently used exports are deleted past this
+EXCEL_MAX_ROWS = 1048576   # Including the header row
+
+# Format label: (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+EXPORT_COLUMNS = list(lead_store.LEAD_COLUMNS)
+# Fixed so every Parquet row group agrees, whatever categories a chunk happens to hold
+PARQUET_SCHEMA = pa.schema([
+    (column, lead_store.TYPES_DTYPE.pyarrow_dtype if column == "Types"
+     else pa.float64() if column in lead_store.FLOAT_COLUMNS else pa.string())
+    for column in EXPORT_COLUMNS
+])
+
+def _chunks(filters, db_path):
+    for chunk in lead_store.iter_leads(chunk_size=EXPORT_CHUNK_ROWS, db_path=db_path, **filters):
+        yield chunk[EXPORT_COLUMNS]
+
+def _write_csv(chunks, file):
+    for number, chunk in enumerate(chunks):
+        # Types is written as ['a', 'b'] so the CSV reads back in
+        chunk.assign(Types=chunk["Types"].map(list)).to_csv(file, index=False, header=number == 0)
+
+def write_csv(chunks, path):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        _write_csv(chunks, file)
+
+def write_csv_gzip(chunks, path):
+    with gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6) as file:
+        _write_csv(chunks, file)
+
+def write_parquet(chunks, path):
+    with pq.ParquetWriter(path, PARQUET_SCHEMA) as writer:
+        for chunk in chunks:
+            chunk = chunk.astype({column: "string" for column in lead_store.CATEGORY_COLUMNS})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=PARQUET_SCHEMA, preserve_index=False))
+
+def write_xlsx(chunks, path):
+    # Write-only mode streams rows to disk instead of building the whole sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Leads")
+    sheet.append(EXPORT_COLUMNS)
+    rows = 1
+    for chunk in chunks:
+        rows += len(chunk)
+        if rows > EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel holds at most {EXCEL_MAX_ROWS - 1} leads; export CSV or Parquet instead")
+        chunk = chunk.assign(Types=chunk["Types"].map(", ".join)).astype(object)
+        for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+WRITERS = {"csv": write_csv, "csv.gz": write_csv_gzip, "parquet": write_parquet, "xlsx": write_xlsx}
+
+def export_path(export_format, filters, db_path=LEADS_DB):
+    """Where the export of the current data version with these filters lives."""
+    extension, _ = EXPORT_FORMATS[export_format]
+    key = json.dumps([lead_store.get_store_tag(db_path), os.path.abspath(db_path), filters], sort_keys=True, default=str)
+    return os.path.join(EXPORT_DIR, f"leads_{hashlib.sha256(key.encode()).hexdigest()[:16]}.{extension}")
+
+def prune_exports(keep=MAX_EXPORT_FILES):
+    paths = sorted((os.path.join(EXPORT_DIR, name) for name in os.listdir(EXPORT_DIR) if not name.endswith(".tmp")),
+                   key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+
+def export_leads(export_format, search=None, keyword=None, job_id=None, db_path=LEADS_DB):
+    """Path of an export of the leads matching the filters, in one of EXPORT_FORMATS.
+
+    Files are reused until the leads change, so asking again for the same data is free.
+    """
+    filters = {"search": search or None, "keyword": keyword or None, "job_id": job_id}
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_path(export_format, filters, db_path)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    extension, _ = EXPORT_FORMATS[export_format]
+    # Written aside and swapped in, so a concurrent download never serves half a file
+    descriptor, temp_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".tmp")
+    os.close(descriptor)
+    try:
+        WRITERS[extension](_chunks(filters, db_path), temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    prune_exports()
+    return path
@@ -2,37 +2,40 @@
 import streamlit as st
 import requests
 import csv
-import re
-import geocoder
-import psutil
 import os
 import json
-from bs4 import BeautifulSoup
 import time
+import threading
+import logging
+from functools import partial
 import pandas as pd
 from io import StringIO
-import matplotlib.pyplot as plt
 from st_aggrid import AgGrid, GridOptionsBuilder, ColumnsAutoSizeMode
 import folium
 from streamlit_folium import st_folium
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import lead_store
+import lead_jobs
+import lead_pipeline
+import dedup
+import lead_analytics
+import lead_export
+from metrics import PipelineMetrics
+from lead_pipeline import (REFRESH_AFTER_DAYS, http_cache, load_config, save_config,
+                           geocode_city_state, get_ip_location, generate_keywords, keyword_search_status, run_job)
 
-CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
 OUTPUT_FILE = os.path.join(os.path.dirname(__file__), "data/compiled_business_listing_data.csv")
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as file:
-            config = json.load(file)
-        return config
-    return {}
-
-def save_config(api_key, cse_id):
-    config = {
-        "API_KEY": api_key,
-        "CSE_ID": cse_id
-    }
-    with open(CONFIG_FILE, 'w') as file:
-        json.dump(config, file)
+class StreamlitLogHandler(logging.Handler):
+    """Shows the pipeline's warnings and errors on the page that started the run."""
+
+    def emit(self, record):
+        if record.levelno >= logging.ERROR:
+            st.error(record.getMessage())
+        else:
+            st.warning(record.getMessage())
+
+lead_pipeline.logger.addHandler(StreamlitLogHandler(logging.WARNING))
 
 def show_instructions():
     st.markdown("""
@@ -63,53 +66,44 @@ def show_instructions():
     2. Click the **Save API Settings** button to store your settings.
     """)
 
-def load_existing_data(output_file):
-    if os.path.exists(output_file):
-        return pd.read_csv(output_file)
-    return pd.DataFrame(columns=["Name", "Address", "Types", "Website", "Email", "Phone Number", "Rating", "Business Type", "Keyword"])
-
-def plot_keywords(data):
-    keywords_count = data['Keyword'].value_counts()
-    fig, ax = plt.subplots()
-    fig.patch.set_facecolor('#0e1117')
-    ax.set_facecolor('#0e1117')
-    keywords_count.plot(kind='barh', ax=ax, color='green')
-    ax.set_title('Keywords Distribution', color='white')
-    ax.set_xlabel('Count', color='white')
-    ax.set_ylabel('Keywords', color='white')
-    ax.tick_params(axis='x', colors='white')
-    ax.tick_params(axis='y', colors='white')
-    st.pyplot(fig)
+def plot_keywords(keyword_counts):
+    # Drawn from the cached aggregate, so reruns only re-send the chart spec
+    st.bar_chart(keyword_counts, x="Keyword", y="Leads", horizontal=True, color="#2e7d32")
+
+def render_analytics(analytics):
+    keywords_tab, ratings_tab, coverage_tab, yield_tab = st.tabs(["Keywords", "Ratings", "Contact Coverage", "Yield per API Call"])
+    with keywords_tab:
+        plot_keywords(analytics["keywords"])
+    with ratings_tab:
+        ratings = analytics["ratings"]
+        column = st.selectbox("Keyword:", ratings.columns, key="analytics_rating_keyword")
+        st.bar_chart(ratings[column], y_label="Leads")
+    with coverage_tab:
+        st.dataframe(analytics["coverage"], hide_index=True, use_container_width=True, column_config={
+            label: st.column_config.ProgressColumn(f"{label} %", format="%.1f%%", min_value=0, max_value=100)
+            for label in lead_analytics.CONTACT_COLUMNS
+        })
+    with yield_tab:
+        st.caption("Leads found per Google request spent on each keyword; cached responses cost nothing.")
+        st.dataframe(analytics["yield"], hide_index=True, use_container_width=True)
 
 def get_lat_long_from_city_state(city, state):
     if not city or not state:
         st.warning("City and State must be provided.")
         return None
 
-    headers = {
-        'User-Agent': 'MyApp/1.0 (myemail@example.com)',
-        'Referer': 'http://yourwebsite.com'
-    }
-    
     try:
-        response = requests.get(
-            f"https://nominatim.openstreetmap.org/search?city={city}&state={state}&format=json&email=myemail@example.com",
-            headers=headers
-        )
-        response.raise_for_status()
-        data = response.json()
-        if data:
-            latitude = data[0].get("lat", "")
-            longitude = data[0].get("lon", "")
-            return float(latitude), float(longitude)
+        latlng = geocode_city_state(city, state)
+        if latlng:
+            return latlng
         else:
             st.warning("Location not found. Using auto-geocoding.")
             return None
     except requests.exceptions.RequestException as e:
         st.error(f"HTTP error occurred: {e}")
         return None
-    except json.decoder.JSONDecodeError:
-        st.error(f"Error decoding JSON response: {response.text}")
+    except json.decoder.JSONDecodeError as e:
+        st.error(f"Error decoding JSON response: {e}")
         return None
     except Exception as e:
         st.error(f"Unexpected error: {e}")
@@ -118,9 +112,9 @@ def get_lat_long_from_city_state(city, state):
 def get_user_location(location_type, city=None, state=None, location=None):
     if location_type == "Auto-geocoding":
         try:
-            user_location = geocoder.ip('me')
-            if user_location.latlng:
-                latitude, longitude = user_location.latlng
+            latlng = get_ip_location()
+            if latlng:
+                latitude, longitude = latlng
                 return latitude, longitude
             else:
                 st.warning("Unable to determine user's location.")
@@ -139,221 +133,140 @@ def get_user_location(location_type, city=None, state=None, location=None):
     st.warning("Using default location: Washington, PA")
     return 40.1740, -80.2462  # Default to Washington, PA if all else fails
 
-def get_website_from_google_search(business_name, API_KEY, CSE_ID):
-    try:
-        response = requests.get(
-            f"https://www.googleapis.com/customsearch/v1?key={API_KEY}&cx={CSE_ID}&q={business_name}"
+def resolve_location(location_type, city=None, state=None, location=None):
+    """get_user_location, but only re-run when the location inputs actually change."""
+    inputs = (location_type, city, state, location)
+    if st.session_state.get("resolved_location_inputs") != inputs:
+        st.session_state.resolved_location = get_user_location(location_type, city, state, location)
+        st.session_state.resolved_location_inputs = inputs
+    return st.session_state.resolved_location
+
+def _attach_script_ctx(ctx):
+    # Let worker threads report warnings to the page that started them
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+def render_keyword_progress(placeholder, tasks, counts):
+    rows = []
+    for keyword, keyword_tasks in tasks.items():
+        keyword_counts = counts[keyword]
+        rows.append({
+            "Keyword": keyword,
+            "Search": keyword_search_status(keyword_tasks),
+            "Cells": len(keyword_tasks),
+            "Found": sum(task.results_written for task in keyword_tasks),
+            "Already Known": keyword_counts["skipped"],
+            "Duplicates": keyword_counts["duplicates"],
+            "Enriched": f"{keyword_counts['enriched']}/{keyword_counts['queued']}",
+        })
+    placeholder.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+def render_metrics(placeholder, metrics):
+    resources = metrics.resources
+    with placeholder.container():
+        st.caption(
+            f"CPU: {resources.cpu_percent:.1f}% (peak {resources.peak_cpu_percent:.1f}%) | "
+            f"RAM: {resources.memory_percent:.1f}% (peak {resources.peak_memory_percent:.1f}%) | "
+            f"Elapsed: {time.time() - metrics.started:.0f}s"
         )
-        response.raise_for_status()
-        data = response.json()
-        website = data.get("items", [{}])[0].get("link", "")
-    except Exception as e:
-        st.warning(f"Error getting website address for {business_name}: {e}")
-        website = ""
-    return website
+        summary = metrics.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary), hide_index=True, use_container_width=True)
+            # Requests per latency bucket, one row per stage
+            histograms = pd.DataFrame([metrics.histogram(row["Stage"]) for row in summary],
+                                      index=[row["Stage"] for row in summary])
+            st.caption("Latency histogram (requests)")
+            st.dataframe(histograms, use_container_width=True)
+
+def generate_leads(keywords, location, API_KEY, CSE_ID, business_type, radius, max_results, refresh_after_days=REFRESH_AFTER_DAYS, tiled=False, job_id=None):
+    """Run (or resume) a lead generation job with live progress on the page."""
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    keyword_progress = st.empty()
+    st.sidebar.subheader("Run Metrics")
+    metrics_panel = st.sidebar.empty()
+    metrics = PipelineMetrics()
+    last_render = 0
+
+    def render_progress(tasks, counts, force=False):
+        nonlocal last_render
+        # Redrawing for every lead would cost more than the lookups on big runs
+        if force or time.monotonic() - last_render > 0.5:
+            render_keyword_progress(keyword_progress, tasks, counts)
+            render_metrics(metrics_panel, metrics)
+            last_render = time.monotonic()
+
+    def on_progress(phase, tasks, counts, done, total):
+        if phase == "searching":
+            status_text.text(f"Searching: {done}/{total} keywords finished")
+        elif phase == "enriching":
+            progress_bar.progress(done / total)
+            status_text.text(f"Enriching: Result {done}/{total}")
+        render_progress(tasks, counts, force=phase == "finished")
+
+    job_id, all_results, counts, status, _ = run_job(
+        keywords, location, API_KEY, CSE_ID, business_type, radius, max_results, refresh_after_days, tiled, job_id,
+        on_progress=on_progress, worker_initializer=partial(_attach_script_ctx, get_script_run_ctx()), metrics=metrics,
+    )
 
-def get_email_address(business_name, API_KEY, CSE_ID):
-    try:
-        response = requests.get(
-            f"https://www.googleapis.com/customsearch/v1?key={API_KEY}&cx={CSE_ID}&q={business_name}",
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
-        items = data.get("items", [])
-        email = ""
-
-        email_regex = r'[\w\.-]+@[\w\.-]+'
-
-        for item in items:
-            snippet = item.get("snippet", "")
-            email_match = re.search(email_regex, snippet)
-            if email_match:
-                email = email_match.group()
-                break
-
-        if not email:
-            website = get_website_from_google_search(business_name, API_KEY, CSE_ID)
-            if website:
-                response = requests.get(website, timeout=30)
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                email_tags = soup.find_all('a', href=True)
-                for tag in email_tags:
-                    if 'mailto:' in tag['href']:
-                        email = tag['href'][7:]
-                        break
+    progress_bar.progress(1.0)
+    skipped = sum(keyword_counts["skipped"] for keyword_counts in counts.values())
+    if status == "done":
+        status_text.text(f"Processing complete! {len(all_results)} enriched, {skipped} already known.")
+    else:
+        status_text.text(f"Job {job_id} stopped with searches or leads unfinished: {len(all_results)} enriched, {skipped} already known. Resume it from Lead Generation Jobs.")
+    return all_results
 
-    except Exception as e:
-        st.warning(f"Error getting email address for {business_name}: {e}")
-        email = ""
+def resume_job(job_id, API_KEY, CSE_ID):
+    spec = lead_jobs.get_spec(job_id)
+    return generate_leads(spec["keywords"], spec["location"], API_KEY, CSE_ID, spec["business_type"], spec["radius"],
+                          spec["max_results"], spec["refresh_after_days"], spec["tiled"], job_id=job_id)
 
-    return email
+# Leads List data is cached per store version, so reruns that don't touch the store skip SQLite entirely
+@st.cache_data(max_entries=64)
+def load_leads_page(data_version, search, keyword, sort_by, descending, page_size, page):
+    return lead_store.query_leads(search=search, keyword=keyword, sort_by=sort_by, descending=descending,
+                                  limit=page_size, offset=(page - 1) * page_size)
 
-def get_phone_number(business_name, API_KEY):
-    try:
-        response = requests.get(
-            f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json?input={business_name}&inputtype=textquery&key={API_KEY}"
-        )
-        data = response.json()
-        candidates = data.get("candidates", [])
-        if candidates:
-            place_id = candidates[0].get("place_id", "")
-            if place_id:
-                details_response = requests.get(
-                    f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&key={API_KEY}"
-                )
-                details_data = details_response.json()
-                phone_number = details_data.get("result", {}).get("formatted_phone_number", "")
-            else:
-                phone_number = ""
-        else:
-            phone_number = ""
-    except Exception as e:
-        st.warning(f"Error getting phone number for {business_name}: {e}")
-        phone_number = ""
-    return phone_number
+@st.cache_data(max_entries=8)
+def load_job_leads(data_version, job_id, limit=250):
+    return lead_store.query_leads(job_id=job_id, limit=limit)
 
-def get_rating(business_name, API_KEY):
-    try:
-        response = requests.get(
-            f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json?input={business_name}&inputtype=textquery&key={API_KEY}"
-        )
-        data = response.json()
-        candidates = data.get("candidates", [])
-        if candidates:
-            place_id = candidates[0].get("place_id", "")
-            if place_id:
-                details_response = requests.get(
-                    f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&key={API_KEY}"
-                )
-                details_data = details_response.json()
-                rating = details_data.get("result", {}).get("rating", "")
-            else:
-                rating = ""
-        else:
-            rating = ""
-    except Exception as e:
-        st.warning(f"Error getting rating for {business_name}: {e}")
-        rating = ""
-    return rating
+@st.cache_data(max_entries=2)
+def load_all_leads(data_version):
+    return lead_store.load_leads()
 
-def generate_keywords(seed_keyword, num_keywords):
-    prompt = f"Remember you are writing {num_keywords} keyword(s) into a CSV file format. Without numbering or extra quotes, one keyword per line. Only generate the list of words. Do NOT include a title or any kind of label, or definition, or explanation, just the list. You are generating {num_keywords} keyword(s) for a business lead search. So be mindful that the user expects results that would be related to their seed keyword in relation to local businesses. Generate {num_keywords} keyword variations for: {seed_keyword}. Come up with {num_keywords} better keyword(s)."
-    
-    try:
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={'model': 'mistral:instruct', 'prompt': prompt, 'context': []},
-            stream=True
-        )
-        response.raise_for_status()
-        
-        full_response = ""
-        for line in response.iter_lines():
-            body = json.loads(line)
-            response_part = body.get('response', '')
-            full_response += response_part
-
-            if 'error' in body:
-                raise Exception(body['error'])
-
-            if body.get('done', False):
-                break
-        
-        keywords = full_response.strip().split("\n")
-        return [keyword.strip() for keyword in keywords if keyword.strip()]
-    except Exception as e:
-        st.error(f"Error generating keywords: {e}")
-        return []
+@st.cache_data(max_entries=2)
+def find_duplicate_groups(data_version):
+    data = load_all_leads(data_version)
+    pairs = dedup.find_duplicates(data)
+    return pairs, dedup.group_duplicates(data, pairs)
 
-def generate_leads(keywords, location, API_KEY, CSE_ID, business_type, radius, max_results):
-    all_results = []
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+@st.cache_data(max_entries=2)
+def load_analytics(data_version):
+    return lead_analytics.build_analytics(load_all_leads(data_version), lead_jobs.api_calls_by_keyword())
 
-    for idx, keyword in enumerate(keywords):
-        results_written = 0
-        next_page_token = None
-
-        while results_written < max_results:
-            request_url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={location}&radius={radius}&type={business_type}&keyword={keyword}&key={API_KEY}"
-            if next_page_token:
-                request_url += f"&pagetoken={next_page_token}"
-
-            response = requests.get(request_url)
-            data = response.json()
-            
-            results = data.get("results", [])
-            
-            for result in results:
-                website = get_website_from_google_search(result.get("name", ""), API_KEY, CSE_ID)
-                email = get_email_address(result.get("name", ""), API_KEY, CSE_ID)
-                phone_number = get_phone_number(result.get("name", ""), API_KEY)
-                rating = get_rating(result.get("name", ""), API_KEY)
-
-                all_results.append([
-                    result.get("name", ""),
-                    result.get("vicinity", ""),
-                    tuple(result.get("types", [])),  # Convert list to tuple
-                    website,
-                    email,
-                    phone_number,
-                    rating,
-                    business_type,
-                    keyword
-                ])
-                results_written += 1
-
-                progress = min((idx * max_results + results_written) / (len(keywords) * max_results), 1.0)
-                progress_bar.progress(progress)
-                status_text.text(f"Processing: Keyword {idx+1}/{len(keywords)}, Result {results_written}/{max_results}")
-
-                cpu_percent = psutil.cpu_percent()
-                memory_percent = psutil.virtual_memory().percent
-                st.sidebar.text(f"CPU: {cpu_percent:.2f}% | RAM: {memory_percent:.2f}%")
-
-                if results_written >= max_results:
-                    break
-
-            next_page_token = data.get("next_page_token", None)
-            if not next_page_token:
-                break
-
-            time.sleep(2)  # To avoid hitting API rate limits
-
-    status_text.text("Processing complete!")
-    return all_results
+def read_export(export_format, search, keyword):
+    # Runs only when the download is clicked; the file itself is reused until the leads change
+    with open(lead_export.export_leads(export_format, search=search, keyword=keyword), 'rb') as file:
+        return file.read()
 
-def append_to_csv(new_results, output_file):
-    if os.path.exists(output_file):
-        existing_data = pd.read_csv(output_file)
-        new_data = pd.DataFrame(new_results, columns=existing_data.columns)
-        # Convert 'Types' column to tuple for deduplication
-        existing_data['Types'] = existing_data['Types'].apply(eval).apply(tuple)
-        new_data['Types'] = new_data['Types'].apply(tuple)
-        combined_data = pd.concat([existing_data, new_data]).drop_duplicates().reset_index(drop=True)
-        combined_data.to_csv(output_file, index=False)
-    else:
-        new_data = pd.DataFrame(new_results, columns=["Name", "Address", "Types", "Website", "Email", "Phone Number", "Rating", "Business Type", "Keyword"])
-        new_data.drop_duplicates().to_csv(output_file, index=False)
+@st.cache_data(max_entries=2)
+def load_keywords(data_version):
+    return lead_store.list_keywords()
 
 # Load available models
 @st.cache_data  # Cache the list of available models
 def get_available_models():
-    response = requests.get(f"http://localhost:11434/api/tags")
-    response.raise_for_status()
-    models = [
-        model["name"]
-        for model in response.json()["models"]
-        if "embed" not in model["name"]
-    ]
-    return models
+    return [model for model in lead_pipeline.ollama_client.list_models() if "embed" not in model]
 
 def run_lead_generator():
     # Load existing configuration
     config = load_config()
 
+    # Leads used to live in a CSV; bring them into the lead store the first time through
+    lead_store.import_csv(OUTPUT_FILE)
+
     # Sidebar for API keys and configuration
     with st.sidebar.expander("API Configuration", expanded=False):
         if st.button("❓", key="instructions_button"):
@@ -365,6 +278,11 @@ def run_lead_generator():
             save_config(API_KEY, CSE_ID)
             st.success("🟢 API settings saved!")
 
+        st.caption(f"API cache: {http_cache.hits} hits, {http_cache.misses} misses")
+        if st.button("🧹 Clear API Cache", key="clear_api_cache_button"):
+            http_cache.clear()
+            st.success("🟢 API cache cleared!")
+
     # Model selection for keyword generation
     st.sidebar.header("Model Selection for Keyword Generation")
     available_models = get_available_models()
@@ -396,10 +314,12 @@ def run_lead_generator():
         radius = st.slider("Search radius (in meters)", 1000, 50000, 50000, 1000)
         business_type = st.selectbox("Select a type of business (Optional):", 
             ["", "accounting", "airport", "amusement_park", "aquarium", "art_gallery", "atm", "bakery", "bank", "bar", "beauty_salon", "bicycle_store", "book_store", "bowling_alley", "bus_station", "cafe", "car_dealership", "car_rental", "car_repair", "car_wash", "casino", "cemetery", "child_care", "clothing_store", "convenience_store", "courthouse", "dentist", "department_store", "doctor", "electrician", "electronics_store", "embassy", "employment_agency", "entertainment_complex", "event_space", "financial_advisor", "florist", "food_court", "funeral_home", "furniture_store", "gas_station", "general_contractor", "grocery_or_supermarket", "gym", "hair_salon", "hardware_store", "health_spa", "home_goods_store", "hospital", "hotel", "insurance_agency", "jewelry_store", "laundry_mat", "lawyer", "library", "liquor_store", "local_government_office", "locksmith", "lodging", "meal_delivery", "meal_takeaway", "mechanic", "movie_theater", "museum", "night_club", "painter", "park", "pharmacy", "physiotherapist", "plumber", "police_station", "post_office", "primary_school", "real_estate_agency", "restaurant", "roofer", "school", "secondary_school", "shopping_mall", "spa", "stadium", "storage", "store", "subway_station", "supermarket", "taxi_stand", "tourist_attraction", "train_station", "university", "veterinarian", "zoo"])
-        max_results = st.number_input("Maximum number of results per keyword", min_value=1, max_value=60, value=1)
+        tiled = st.checkbox("Full coverage (split the area into tiles)", help="Searches smaller and smaller tiles wherever Google's 60-result cap is hit, so dense areas aren't limited to the top 60.")
+        max_results = st.number_input("Maximum number of results per keyword", min_value=1, max_value=60, value=1, disabled=tiled)
+        refresh_after_days = st.number_input("Re-enrich known leads older than (days)", min_value=0, max_value=365, value=REFRESH_AFTER_DAYS)
 
     with col3:
-        location = get_user_location(location_type, city, state, location)
+        location = resolve_location(location_type, city, state, location)
         if location:
             m = folium.Map(location=location, zoom_start=12)
             folium.Marker(location=location).add_to(m)
@@ -410,49 +330,155 @@ def run_lead_generator():
             st.error("Please enter all required API keys in the sidebar.")
         else:
             with st.spinner("Generating keywords..."):
-                keywords = generate_keywords(seed_keyword, num_keywords)
+                keywords = generate_keywords(seed_keyword, num_keywords, model=selected_model,
+                                             options=lead_pipeline.KEYWORD_OPTIONS.with_changes(temperature=temperature))
                 st.write("Generated Keywords:", keywords)
 
             with st.spinner("Generating leads..."):
-                all_results = generate_leads(keywords, f"{location[0]},{location[1]}", API_KEY, CSE_ID, business_type, radius, max_results)
-                append_to_csv(all_results, OUTPUT_FILE)
+                # Leads are stored as they're enriched, so there's nothing left to save here
+                generate_leads(keywords, f"{location[0]},{location[1]}", API_KEY, CSE_ID, business_type, radius, max_results, refresh_after_days, tiled)
                 st.success("🎉 Leads generated successfully!")  # Add a success message instead of rerunning
                 st.balloons()
 
-    # Load existing data
-    existing_data = load_existing_data(OUTPUT_FILE)
+    with st.expander("🧾 Lead Generation Jobs"):
+        jobs = lead_jobs.list_jobs()
+        if jobs.empty:
+            st.write("No jobs yet.")
+        else:
+            st.dataframe(jobs, hide_index=True, use_container_width=True)
+            job_id = st.selectbox("Job:", jobs["Job"], key="selected_job")
+            job_status = jobs.loc[jobs["Job"] == job_id, "Status"].iloc[0]
+            if st.button("▶️ Resume Job", key="resume_job_button", disabled=job_status != "interrupted"):
+                if not API_KEY or not CSE_ID:
+                    st.error("Please enter all required API keys in the sidebar.")
+                else:
+                    with st.spinner(f"Resuming job {job_id}..."):
+                        resume_job(job_id, API_KEY, CSE_ID)
+                    st.success(f"🎉 Job {job_id} finished!")
+            # Leads are written as they're enriched, so this shows a running job's partial results too
+            if st.checkbox("Show this job's leads", key="show_job_leads"):
+                job_leads, job_total = load_job_leads(lead_store.get_data_version(), job_id)
+                st.caption(f"{job_total} leads stored for job {job_id}")
+                st.dataframe(job_leads.drop(columns=[lead_store.KEY_COLUMN]), hide_index=True, use_container_width=True)
+
+    with st.expander("📊 Lead Analytics"):
+        if st.checkbox("Show analytics", key="show_analytics"):
+            render_analytics(load_analytics(lead_store.get_data_version()))
+
+    with st.expander("🧬 Duplicate Leads"):
+        if st.button("🔍 Find Duplicates", key="find_duplicates_button"):
+            st.session_state.show_duplicates = True
+        if st.session_state.get("show_duplicates"):
+            data_version = lead_store.get_data_version()
+            pairs, groups = find_duplicate_groups(data_version)
+            if not groups:
+                st.write("No duplicates found.")
+            else:
+                leads = load_all_leads(data_version).set_index(lead_store.KEY_COLUMN)
+                st.caption(f"{len(groups)} group(s) covering {sum(len(merged) for _, merged in groups)} duplicate lead(s); "
+                           "the first lead of each group is kept")
+                st.dataframe(pd.DataFrame([
+                    {"Group": group, "Keep": key == survivor, **leads.loc[key, ["Name", "Address", "Phone Number", "Website", "Keyword"]]}
+                    for group, (survivor, merged) in enumerate(groups, 1)
+                    for key in [survivor] + merged
+                ]), hide_index=True, use_container_width=True)
+                if st.checkbox("Show pair scores", key="show_duplicate_pairs"):
+                    st.dataframe(pairs.drop(columns=["left", "right"]), hide_index=True, use_container_width=True)
+                if st.button("🧬 Merge Duplicates", key="merge_duplicates_button"):
+                    merged = lead_store.merge_leads(groups)
+                    st.session_state.show_duplicates = False
+                    st.success(f"🟢 Merged {merged} duplicate lead(s). Merges can be undone below.")
+
+        merges = lead_store.list_merges()
+        if not merges.empty:
+            st.write("Recent merges:")
+            st.dataframe(merges, hide_index=True, use_container_width=True)
+            merge_id = st.selectbox("Merge:", merges["Merge"], key="selected_merge")
+            if st.button("↩️ Undo Merge", key="undo_merge_button", ):
+                lead_store.undo_merge(merge_id)
+                st.success(f"Merge {merge_id} undone.")
 
     # Display existing data
     st.subheader("Leads List")
+    data_version = lead_store.get_data_version()
+
+    col6, col7, col8, col9 = st.columns([2, 1, 1, 1])
+    with col6:
+        search = st.text_input("Search leads:", key="leads_search")
+    with col7:
+        keyword_filter = st.selectbox("Keyword:", ["All"] + load_keywords(data_version), key="leads_keyword_filter")
+    with col8:
+        sort_by = st.selectbox("Sort by:", ["Added"] + [column for column in lead_store.LEAD_COLUMNS if column != "Types"], key="leads_sort_by")
+        descending = st.checkbox("Descending", key="leads_descending")
+    with col9:
+        page_size = st.selectbox("Rows per page:", [25, 50, 100, 250], index=1, key="leads_page_size")
+
+    keyword_filter = None if keyword_filter == "All" else keyword_filter
+    sort_by = None if sort_by == "Added" else sort_by
+    _, total = load_leads_page(data_version, search, keyword_filter, sort_by, descending, 1, 1)
+    page_count = max(1, -(-total // page_size))
+    if st.session_state.get("leads_page", 1) > page_count:
+        st.session_state.leads_page = page_count  # The filter shrank the result set
+    page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, key="leads_page")
+    # The browser's grid keeps the page it was built from, so edits are diffed against that page. Diffing against a
+    # newer one would take someone else's save for a change of ours and apply_edits would undo it. The page is only
+    # reloaded for new data once there's nothing unsaved in the grid.
+    query = (search, keyword_filter, sort_by, descending, page_size, page)
+    grid_page = st.session_state.get("leads_grid_page")
+    if grid_page is None or grid_page["query"] != query or (
+            grid_page["data_version"] != data_version and not st.session_state.get("leads_grid_dirty")):
+        existing_data, total = load_leads_page(data_version, search, keyword_filter, sort_by, descending, page_size, page)
+        grid_page = st.session_state.leads_grid_page = {
+            "query": query, "data_version": data_version, "data": existing_data, "total": total,
+        }
+    existing_data, total = grid_page["data"], grid_page["total"]
+    st.caption(f"Showing {len(existing_data) and (page - 1) * page_size + 1}–{(page - 1) * page_size + len(existing_data)} of {total} leads")
+
     grid_options = GridOptionsBuilder.from_dataframe(existing_data)
     grid_options.configure_default_column(editable=True)
+    grid_options.configure_column(lead_store.KEY_COLUMN, hide=True, editable=False)
+    for column in ("Place ID", "Latitude", "Longitude"):
+        grid_options.configure_column(column, editable=False)
     grid_options = grid_options.build()
     
     # Use st.empty() to create a placeholder for the AgGrid
     grid_placeholder = st.empty()
     
-    # Display the AgGrid in the placeholder
+    # Only the current page is sent to the browser, so skip the client-side auto-size pass
     with grid_placeholder:
-        edited_data = AgGrid(existing_data, gridOptions=grid_options, update_mode="value_changed", columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS)
+        edited_data = AgGrid(existing_data, gridOptions=grid_options, update_mode="value_changed", columns_auto_size_mode=ColumnsAutoSizeMode.NO_AUTOSIZE)
+    edits = lead_store.diff_leads(existing_data, pd.DataFrame(edited_data['data']))
+    st.session_state.leads_grid_dirty = bool(edits)
 
     # Save edited data
     col4, col5 = st.columns([1, 1])
     with col4:
         if st.button("✅ Save Changes"):
-            if edited_data['data'].equals(existing_data):
+            # Only the cells that changed are written, and only if nobody else saved them first
+            if not edits:
                 st.write("No changes to save.")
             else:
-                edited_df = pd.DataFrame(edited_data['data'])
-                edited_df.to_csv(OUTPUT_FILE, index=False)
-                st.success("🟢 Changes saved!")
+                saved, conflicts = lead_store.apply_edits(edits, editor=get_script_run_ctx().session_id)
+                # Rebuilt from the store on the next run, with these edits and anyone else's
+                st.session_state.pop("leads_grid_page", None)
+                st.session_state.leads_grid_dirty = False
+                if saved:
+                    st.success(f"🟢 Saved {saved} changed cell(s)!")
+                if conflicts:
+                    st.warning(f"{len(conflicts)} cell(s) were changed by someone else since this page loaded and were not saved:")
+                    st.dataframe(pd.DataFrame(conflicts).rename(columns={
+                        "lead_key": lead_store.KEY_COLUMN, "column": "Column", "old": "Was", "new": "Yours", "current": "Theirs",
+                    }), hide_index=True, use_container_width=True)
 
     with col5:
-        csv = existing_data.to_csv(index=False)
+        export_format = st.selectbox("Export format:", list(lead_export.EXPORT_FORMATS), key="export_format")
+        filtered = st.checkbox("Only leads matching the search and keyword", key="export_filtered", disabled=not (search or keyword_filter))
+        extension, mime = lead_export.EXPORT_FORMATS[export_format]
         st.download_button(
-            label="📥 Download CSV",
-            data=csv,
-            file_name='compiled_business_listing_data.csv',
-            mime='text/csv',
+            label="📥 Download Leads",
+            data=partial(read_export, export_format, search if filtered else None, keyword_filter if filtered else None),
+            file_name=f'compiled_business_listing_data.{extension}',
+            mime=mime,
             key="download_csv_button"
         )
 
@@ -0,0 +1,171 @@
+# TeamWork leads/lead_jobs.py
+import json
+import time
+import pandas as pd
+import lead_store
+from lead_store import LEADS_DB, get_db_connection
+
+# A running job checkpoints at least this often; quieter ones were interrupted
+HEARTBEAT_TIMEOUT = 60
+# Google only honours a next_page_token for a few minutes; older ones restart their search
+PAGE_TOKEN_MAX_AGE = 120
+
+def init_db(db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                        (job_id INTEGER PRIMARY KEY AUTOINCREMENT, spec TEXT, status TEXT,
+                         created_at REAL, updated_at REAL)''')
+        # One row per nearbysearch (a keyword, or one tile of it): the resume point for its pagination
+        conn.execute('''CREATE TABLE IF NOT EXISTS job_searches
+                        (search_id INTEGER PRIMARY KEY AUTOINCREMENT, job_id INTEGER, keyword TEXT, cell TEXT,
+                         page_token TEXT, results_written INTEGER, status TEXT, checkpoint_at REAL)''')
+        # Search results waiting for enrichment; removed in the same transaction that stores the lead
+        conn.execute('''CREATE TABLE IF NOT EXISTS job_pending
+                        (pending_id INTEGER PRIMARY KEY AUTOINCREMENT, job_id INTEGER, keyword TEXT,
+                         place_id TEXT, result TEXT)''')
+        # Google requests spent on each keyword (cache hits cost nothing), for yield per API call
+        conn.execute('''CREATE TABLE IF NOT EXISTS job_api_calls
+                        (job_id INTEGER, keyword TEXT, requests INTEGER, PRIMARY KEY (job_id, keyword))''')
+        conn.execute("CREATE INDEX IF NOT EXISTS job_searches_job_id ON job_searches (job_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS job_pending_job_id ON job_pending (job_id)")
+        conn.commit()
+
+def _touch(conn, job_id, status="running"):
+    conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+def create_job(spec, db_path=LEADS_DB):
+    """Record a new job. spec holds the search settings (never API keys) needed to resume it."""
+    now = time.time()
+    with get_db_connection(db_path) as conn:
+        cursor = conn.execute("INSERT INTO jobs (spec, status, created_at, updated_at) VALUES (?, 'running', ?, ?)",
+                              (json.dumps(spec), now, now))
+        conn.commit()
+        return cursor.lastrowid
+
+def start_job(job_id, db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        _touch(conn, job_id)
+        conn.commit()
+
+def get_spec(job_id, db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        row = conn.execute("SELECT spec FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def add_search(job_id, keyword, cell, db_path=LEADS_DB):
+    """Record a search before it starts and return its search_id. cell is (lat, lng, radius, depth)."""
+    with get_db_connection(db_path) as conn:
+        cursor = conn.execute(
+            "INSERT INTO job_searches (job_id, keyword, cell, page_token, results_written, status, checkpoint_at) "
+            "VALUES (?, ?, ?, NULL, 0, 'queued', ?)",
+            (job_id, keyword, json.dumps(cell), time.time())
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+def checkpoint_page(job_id, search_id, page_token, results_written, status, results, keyword, db_path=LEADS_DB):
+    """Advance a search past a page and queue that page's results for enrichment, atomically.
+
+    Returns the pending_id of each result, in order.
+    """
+    now = time.time()
+    with get_db_connection(db_path) as conn:
+        conn.execute(
+            "UPDATE job_searches SET page_token = ?, results_written = ?, status = ?, checkpoint_at = ? WHERE search_id = ?",
+            (page_token, results_written, status, now, search_id)
+        )
+        pending_ids = [
+            conn.execute("INSERT INTO job_pending (job_id, keyword, place_id, result) VALUES (?, ?, ?, ?)",
+                         (job_id, keyword, result.get("place_id"), json.dumps(result))).lastrowid
+            for result in results
+        ]
+        _touch(conn, job_id)
+        conn.commit()
+    return pending_ids
+
+def fail_search(job_id, search_id, db_path=LEADS_DB):
+    # checkpoint_at stays the time of the last page, so a resume can tell whether its token is still good
+    with get_db_connection(db_path) as conn:
+        conn.execute("UPDATE job_searches SET status = 'failed' WHERE search_id = ?", (search_id,))
+        _touch(conn, job_id)
+        conn.commit()
+
+def store_lead(job_id, pending_id, row, db_path=LEADS_DB):
+    """Save an enriched lead and drop it from the job's pending queue in one transaction."""
+    with get_db_connection(db_path) as conn:
+        lead_store.write_leads(conn, [row], job_id)
+        conn.execute("DELETE FROM job_pending WHERE pending_id = ?", (pending_id,))
+        _touch(conn, job_id)
+        conn.commit()
+
+def record_api_calls(job_id, keyword_requests, db_path=LEADS_DB):
+    """Add a run's {keyword: Google requests} to the job's totals; a resumed job runs more than once."""
+    with get_db_connection(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO job_api_calls (job_id, keyword, requests) VALUES (?, ?, ?) "
+            "ON CONFLICT (job_id, keyword) DO UPDATE SET requests = requests + excluded.requests",
+            [(job_id, keyword, requests) for keyword, requests in keyword_requests.items()]
+        )
+        lead_store.bump_version(conn)
+        conn.commit()
+
+def api_calls_by_keyword(db_path=LEADS_DB):
+    """Google requests spent on each keyword, over every job."""
+    with get_db_connection(db_path) as conn:
+        return pd.read_sql_query("SELECT keyword AS Keyword, SUM(requests) AS Requests FROM job_api_calls GROUP BY keyword", conn)
+
+def finish_job(job_id, db_path=LEADS_DB):
+    """Mark a job done, or interrupted if some of its searches failed or its searches or results were never finished."""
+    with get_db_connection(db_path) as conn:
+        pending = conn.execute("SELECT COUNT(*) FROM job_pending WHERE job_id = ?", (job_id,)).fetchone()[0]
+        searching = conn.execute("SELECT COUNT(*) FROM job_searches WHERE job_id = ? AND status != 'done'",
+                                 (job_id,)).fetchone()[0]
+        status = "interrupted" if pending or searching else "done"
+        _touch(conn, job_id, status)
+        conn.commit()
+    return status
+
+def load_job(job_id, db_path=LEADS_DB):
+    """Return (searches, pending results, place_ids already stored) for resuming a job."""
+    with get_db_connection(db_path) as conn:
+        searches = [
+            {"search_id": search_id, "keyword": keyword, "cell": json.loads(cell), "page_token": page_token,
+             "results_written": results_written, "status": status, "checkpoint_at": checkpoint_at}
+            for search_id, keyword, cell, page_token, results_written, status, checkpoint_at in conn.execute(
+                "SELECT search_id, keyword, cell, page_token, results_written, status, checkpoint_at "
+                "FROM job_searches WHERE job_id = ? ORDER BY search_id", (job_id,))
+        ]
+        pending = [
+            {"pending_id": pending_id, "keyword": keyword, "result": json.loads(result)}
+            for pending_id, keyword, result in conn.execute(
+                "SELECT pending_id, keyword, result FROM job_pending WHERE job_id = ? ORDER BY pending_id", (job_id,))
+        ]
+        stored = {row[0] for row in conn.execute("SELECT place_id FROM leads WHERE job_id = ? AND place_id IS NOT NULL", (job_id,))}
+    return searches, pending, stored
+
+def list_jobs(limit=20, db_path=LEADS_DB):
+    """Most recent jobs first, with their progress. Running jobs that stopped checkpointing show as interrupted."""
+    with get_db_connection(db_path) as conn:
+        data = pd.read_sql_query(
+            '''SELECT j.job_id, j.spec, j.status, j.created_at, j.updated_at,
+                      (SELECT COUNT(*) FROM job_searches s WHERE s.job_id = j.job_id AND s.status = 'done') AS searches_done,
+                      (SELECT COUNT(*) FROM job_searches s WHERE s.job_id = j.job_id) AS searches,
+                      (SELECT COUNT(*) FROM job_pending p WHERE p.job_id = j.job_id) AS pending,
+                      (SELECT COUNT(*) FROM leads l WHERE l.job_id = j.job_id) AS leads
+               FROM jobs j ORDER BY j.job_id DESC LIMIT ?''',
+            conn, params=[limit]
+        )
+    stale = (data["status"] == "running") & (time.time() - data["updated_at"] > HEARTBEAT_TIMEOUT)
+    data.loc[stale, "status"] = "interrupted"
+    specs = data["spec"].map(json.loads)
+    return pd.DataFrame({
+        "Job": data["job_id"],
+        "Started": pd.to_datetime(data["created_at"], unit="s").dt.strftime("%Y-%m-%d %H:%M"),
+        "Keywords": specs.map(lambda spec: ", ".join(spec["keywords"])),
+        "Status": data["status"],
+        "Searches": data["searches_done"].astype(str) + "/" + data["searches"].astype(str),
+        "Pending": data["pending"],
+        "Leads": data["leads"],
+    })
+
+init_db()
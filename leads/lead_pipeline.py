@@ -0,0 +1,409 @@
+# TeamWork leads/lead_pipeline.py
+# The lead generation pipeline without any UI, shared by the Streamlit page and the batch CLI
+import requests
+import geocoder
+import logging
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# Several leads/ modules import from the repo root (lru_store, timing_utils, ollama_client), which isn't on the
+# path when a leads/ script is run directly. Every entry point imports this module first, so it's added once here.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_cache import HttpCache
+import lead_store
+import lead_jobs
+import email_crawler
+import tiling
+from metrics import PipelineMetrics
+from rate_limit import RateLimiter
+from search_scheduler import SearchScheduler, SearchTask
+from timing_utils import backoff_delay
+from ollama_client import GenerationOptions, client as ollama_client
+
+logger = logging.getLogger("lead_pipeline")
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+REFRESH_AFTER_DAYS = 30  # Known places older than this are enriched again
+KEYWORD_MODEL = "mistral:instruct"
+KEYWORD_OPTIONS = GenerationOptions(temperature=0.2)
+KEYWORD_TOKENS = 16  # Generation budget per keyword asked for, so a rambling model gets cut off
+
+# Enrichment runs on a thread pool; each API gets its own concurrency limit
+ENRICH_WORKERS = 16
+KEYWORD_CONCURRENCY = 4  # Keywords searched at the same time
+API_LIMITS = {
+    "places": 4,  # Google Places (nearbysearch, findplacefromtext, details)
+    "cse": 2,     # Google Custom Search
+    "web": 12,    # Business websites
+}
+API_SEMAPHORES = {api: threading.BoundedSemaphore(limit) for api, limit in API_LIMITS.items()}
+
+# Google quotas are shared by everyone using this server, so the limiters are too
+RATE_LIMITS = {
+    "places": {"name": "Places", "rate": 10, "capacity": 10},
+    "cse": {"name": "Custom Search", "rate": 1.5, "capacity": 5, "daily_limit": 10000},
+}
+
+def make_rate_limiters(share=1.0):
+    """Limiters for `share` of each quota, for when several processes split one API key."""
+    limiters = {}
+    for api, limits in RATE_LIMITS.items():
+        daily_limit = limits.get("daily_limit")
+        limiters[api] = RateLimiter(limits["name"], rate=limits["rate"] * share,
+                                    capacity=max(1, limits["capacity"] * share),
+                                    daily_limit=int(daily_limit * share) if daily_limit else None)
+    return limiters
+
+RATE_LIMITERS = make_rate_limiters()
+MAX_RETRIES = 4
+
+def api_get(api, url, metrics, stage, keyword=None, **kwargs):
+    """requests.get() under the API's rate limit and concurrency cap. Only the request itself is timed
+    under stage; the time spent waiting for the limiter and the semaphore is recorded as its wait."""
+    kwargs.setdefault("timeout", 30)
+    queued = time.perf_counter()
+    limiter = RATE_LIMITERS.get(api)
+    if limiter:
+        limiter.acquire()
+    with API_SEMAPHORES[api]:
+        metrics.record_wait(stage, time.perf_counter() - queued)
+        with metrics.timed(stage, keyword):
+            return requests.get(url, **kwargs)
+
+def fetch_website(url):
+    with API_SEMAPHORES["web"]:
+        return email_crawler.fetch_page(url)
+
+# Overridable so the pipeline can run against a local stand-in (see mock_google.py)
+PLACES_API_URL = os.environ.get("PLACES_API_URL", "https://maps.googleapis.com/maps/api/place")
+CSE_API_URL = os.environ.get("CSE_API_URL", "https://www.googleapis.com/customsearch/v1")
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_LIMITER = RateLimiter("Nominatim", rate=1, capacity=1)
+
+# Google responses are cached on disk and shared by every run
+http_cache = HttpCache()
+
+ENDPOINT_STAGES = {
+    "nearbysearch": "search",
+    "findplacefromtext": "details",
+    "details": "details",
+    "customsearch": "cse",
+}
+
+# The keyword a worker thread is enriching a result for, so its API requests are charged to it
+current_keyword = contextvars.ContextVar("current_keyword", default=None)
+# The metrics of the job a worker thread is working for; each run_job has its own, so concurrent
+# jobs never count each other's requests. Calls made outside a job land in the default.
+current_metrics = contextvars.ContextVar("current_metrics", default=PipelineMetrics())
+
+def is_cacheable(data):
+    return "error" not in data and data.get("status", "OK") in ("OK", "ZERO_RESULTS")
+
+def google_get(endpoint, params, metrics=None):
+    metrics = metrics or current_metrics.get()
+    if endpoint == "customsearch":
+        api, url = "cse", CSE_API_URL
+    else:
+        api, url = "places", f"{PLACES_API_URL}/{endpoint}/json"
+    stage = ENDPOINT_STAGES[endpoint]
+    keyword = params.get("keyword") if endpoint == "nearbysearch" else current_keyword.get()
+    metrics.count_call(stage)
+
+    def fetch():
+        for attempt in range(MAX_RETRIES + 1):
+            response = api_get(api, url, metrics, stage, keyword, params=params)
+            # Rate limited or a server hiccup: failing here would drop the rest of a keyword's pages
+            if (response.status_code == 429 or response.status_code >= 500) and attempt < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if data.get("status") == "OVER_QUERY_LIMIT" and attempt < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
+                continue
+            return data
+
+    return http_cache.fetch(endpoint, params, fetch, cacheable=is_cacheable)
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r') as file:
+            config = json.load(file)
+        return config
+    return {}
+
+def save_config(api_key, cse_id):
+    config = {
+        "API_KEY": api_key,
+        "CSE_ID": cse_id
+    }
+    with open(CONFIG_FILE, 'w') as file:
+        json.dump(config, file)
+
+def normalize_place_name(name):
+    return " ".join(name.split()).lower()
+
+def geocode_city_state(city, state):
+    """(latitude, longitude) of a city from Nominatim, or None if it can't be found. HTTP errors are raised."""
+    headers = {
+        'User-Agent': 'MyApp/1.0 (myemail@example.com)',
+        'Referer': 'http://yourwebsite.com'
+    }
+    params = {"city": normalize_place_name(city), "state": normalize_place_name(state), "format": "json", "email": "myemail@example.com"}
+
+    def fetch():
+        # Nominatim's usage policy allows at most one request per second
+        NOMINATIM_LIMITER.acquire()
+        response = requests.get(NOMINATIM_URL, params=params, headers=headers, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    data = http_cache.fetch("nominatim", params, fetch, cacheable=bool)
+    if data:
+        return float(data[0].get("lat", "")), float(data[0].get("lon", ""))
+    return None
+
+def get_ip_location():
+    # Keyed on "me": the server's own public IP, which rarely changes within the TTL
+    return http_cache.fetch("ip_geocode", {"ip": "me"}, lambda: geocoder.ip('me').latlng or [], cacheable=bool)
+
+def get_website_from_google_search(business_name, API_KEY, CSE_ID):
+    try:
+        data = google_get("customsearch", {"key": API_KEY, "cx": CSE_ID, "q": business_name})
+        website = data.get("items", [{}])[0].get("link", "")
+    except Exception as e:
+        logger.warning(f"Error getting website address for {business_name}: {e}")
+        website = ""
+    return website
+
+def get_email_address(business_name, API_KEY, CSE_ID, website=None):
+    try:
+        data = google_get("customsearch", {"key": API_KEY, "cx": CSE_ID, "q": business_name})
+        items = data.get("items", [])
+        email = ""
+
+        for item in items:
+            emails = email_crawler.extract_emails(item.get("snippet", ""))
+            if emails:
+                email = emails[0]
+                break
+
+        if not email:
+            if not website:
+                website = get_website_from_google_search(business_name, API_KEY, CSE_ID)
+            if website:
+                metrics = current_metrics.get()
+                metrics.count_call("crawl")
+                with metrics.timed("crawl"):
+                    email = email_crawler.crawl_for_email(website, fetch=fetch_website)
+
+    except Exception as e:
+        logger.warning(f"Error getting email address for {business_name}: {e}")
+        email = ""
+
+    return email
+
+# Only request the fields we store; Google bills Details by the fields asked for
+PLACE_DETAILS_FIELDS = "formatted_phone_number,rating,website,geometry"
+
+def find_place_id(business_name, API_KEY):
+    try:
+        data = google_get("findplacefromtext", {"input": business_name, "inputtype": "textquery", "key": API_KEY})
+        candidates = data.get("candidates", [])
+        if candidates:
+            return candidates[0].get("place_id", "")
+    except Exception as e:
+        logger.warning(f"Error finding place for {business_name}: {e}")
+    return ""
+
+def get_place_details(place_id, API_KEY):
+    try:
+        data = google_get("details", {"place_id": place_id, "fields": PLACE_DETAILS_FIELDS, "key": API_KEY})
+        return data.get("result", {})
+    except Exception as e:
+        logger.warning(f"Error getting place details for {place_id}: {e}")
+        return {}
+
+def generate_keywords(seed_keyword, num_keywords, model=KEYWORD_MODEL, options=KEYWORD_OPTIONS):
+    prompt = f"Remember you are writing {num_keywords} keyword(s) into a CSV file format. Without numbering or extra quotes, one keyword per line. Only generate the list of words. Do NOT include a title or any kind of label, or definition, or explanation, just the list. You are generating {num_keywords} keyword(s) for a business lead search. So be mindful that the user expects results that would be related to their seed keyword in relation to local businesses. Generate {num_keywords} keyword variations for: {seed_keyword}. Come up with {num_keywords} better keyword(s)."
+
+    try:
+        options = options.with_changes(num_predict=options.num_predict or max(64, KEYWORD_TOKENS * num_keywords))
+        full_response = ollama_client.generate(model, prompt, context=[], options=options)["response"]
+        keywords = full_response.strip().split("\n")
+        return [keyword.strip() for keyword in keywords if keyword.strip()]
+    except Exception as e:
+        logger.error(f"Error generating keywords: {e}")
+        return []
+
+def enrich_result(result, API_KEY, CSE_ID, business_type, keyword, metrics=None):
+    metrics = metrics or current_metrics.get()
+    # Worker threads don't inherit the submitting thread's context, so the job is named here
+    current_metrics.set(metrics)
+    current_keyword.set(keyword)
+    metrics.count_call("enrich")
+    with metrics.timed("enrich"):
+        business_name = result.get("name", "")
+        place_id = result.get("place_id") or find_place_id(business_name, API_KEY)
+        details = get_place_details(place_id, API_KEY) if place_id else {}
+
+        website = details.get("website") or get_website_from_google_search(business_name, API_KEY, CSE_ID)
+        email = get_email_address(business_name, API_KEY, CSE_ID, website=website)
+        phone_number = details.get("formatted_phone_number", "")
+        rating = details.get("rating")
+        # nearbysearch already has the coordinates; Details only fills in for results without them
+        location = (result.get("geometry") or details.get("geometry") or {}).get("location", {})
+
+    return [
+        result.get("name", ""),
+        result.get("vicinity", ""),
+        list(result.get("types", [])),
+        website,
+        email,
+        phone_number,
+        rating,
+        business_type,
+        keyword,
+        place_id,
+        location.get("lat"),
+        location.get("lng"),
+    ]
+
+def keyword_search_status(keyword_tasks):
+    statuses = {task.status for task in keyword_tasks}
+    if statuses <= {"done", "failed"}:
+        return "failed" if statuses == {"failed"} else "done"
+    return "searching" if statuses - {"queued"} else "queued"
+
+def run_job(keywords, location, API_KEY, CSE_ID, business_type, radius, max_results, refresh_after_days=REFRESH_AFTER_DAYS,
+            tiled=False, job_id=None, on_progress=None, worker_initializer=None, metrics=None):
+    """Search, enrich and store leads as a checkpointed job; pass the job_id of an interrupted job to resume it.
+
+    on_progress(phase, tasks, counts, done, total) is called on this thread as searches
+    ("searching") and enrichments ("enriching") finish, and once more at the end ("finished").
+    Pass a PipelineMetrics to watch it during the run; otherwise the job gets a new one.
+    Returns (job_id, enriched rows, per-keyword counts, final job status, the job's PipelineMetrics).
+    """
+    metrics = metrics or PipelineMetrics()
+    metrics.resources.start()
+    try:
+        keywords = list(dict.fromkeys(keywords))
+        if job_id is None:
+            job_id = lead_jobs.create_job({
+                "keywords": keywords, "location": location, "business_type": business_type, "radius": radius,
+                "max_results": max_results, "refresh_after_days": refresh_after_days, "tiled": tiled,
+            })
+        else:
+            lead_jobs.start_job(job_id)
+        saved_searches, pending, stored_place_ids = lead_jobs.load_job(job_id)
+        futures = {}
+        seen_place_ids = set(stored_place_ids) | {item["result"].get("place_id") for item in pending}
+        counts = {keyword: {"skipped": 0, "duplicates": 0, "queued": 0, "enriched": 0} for keyword in keywords}
+        stale_before = time.time() - refresh_after_days * 24 * 3600
+        latitude, longitude = map(float, location.split(","))
+        tasks = {keyword: [] for keyword in keywords}
+        on_progress = on_progress or (lambda *args: None)
+
+        # Results are enriched in the background while the next pages are being fetched
+        with ThreadPoolExecutor(max_workers=ENRICH_WORKERS, initializer=worker_initializer) as executor:
+            def enrich(result, keyword, pending_id):
+                counts[keyword]["queued"] += 1
+                future = executor.submit(enrich_result, result, API_KEY, CSE_ID, business_type, keyword, metrics)
+                futures[future] = keyword
+                # Each lead is stored from the worker that enriched it, so partial results survive a crash
+                future.add_done_callback(lambda done: done.exception() or lead_jobs.store_lead(job_id, pending_id, done.result()))
+
+            def add_search(keyword, cell, saved=None):
+                params = {"location": cell.location, "radius": round(cell.radius), "type": business_type, "keyword": keyword, "key": API_KEY}
+                # In tiling mode every cell is searched to Google's cap so we can tell when to split it
+                task_max_results = tiling.RESULT_CAP if tiled else max_results
+                if saved is None:
+                    search_id = lead_jobs.add_search(job_id, keyword, [cell.lat, cell.lng, cell.radius, cell.depth])
+                    task = scheduler.add(keyword, params, task_max_results)
+                elif saved["status"] == "done":
+                    search_id = saved["search_id"]
+                    task = SearchTask(keyword, params, task_max_results)
+                    task.status = saved["status"]
+                    task.results_written = saved["results_written"]
+                else:
+                    # Unfinished or failed: picked up from its last page while the token is still good
+                    search_id = saved["search_id"]
+                    task = scheduler.add(keyword, params, task_max_results)
+                    if saved["page_token"] and time.time() - saved["checkpoint_at"] <= lead_jobs.PAGE_TOKEN_MAX_AGE:
+                        task.page_token = saved["page_token"]
+                        task.results_written = saved["results_written"]
+                task.search_id = search_id
+                task.cell = cell
+                tasks[keyword].append(task)
+
+            def on_results(task, results):
+                keyword_counts = counts[task.keyword]
+                if tiled:
+                    # Child cells overlap their neighbours and reach past the search circle
+                    results = [result for result in results if tiling.within(result, task.cell) and tiling.within(result, root_cell)]
+                    if task.status == "done" and tiling.is_saturated(task.results_written) and task.cell.can_split():
+                        for child in task.cell.split():
+                            add_search(task.keyword, child)
+
+                # Only new or stale places go through the expensive enrichment path
+                known = lead_store.get_known_places(result["place_id"] for result in results if result.get("place_id"))
+                queued = []
+                for result in results:
+                    place_id = result.get("place_id")
+                    if place_id in seen_place_ids:
+                        keyword_counts["duplicates"] += 1
+                        continue
+                    seen_place_ids.add(place_id)
+                    last_enriched = known.get(place_id)
+                    if last_enriched is not None and last_enriched >= stale_before:
+                        keyword_counts["skipped"] += 1
+                        continue
+                    queued.append(result)
+
+                # The page's results are queued durably before the search moves past it
+                pending_ids = lead_jobs.checkpoint_page(job_id, task.search_id, task.page_token, task.results_written,
+                                                        task.status, queued, task.keyword)
+                for result, pending_id in zip(queued, pending_ids):
+                    enrich(result, task.keyword, pending_id)
+
+                searched = sum(keyword_search_status(keyword_tasks) in ("done", "failed") for keyword_tasks in tasks.values())
+                on_progress("searching", tasks, counts, searched, len(tasks))
+
+            def on_error(task, error):
+                lead_jobs.fail_search(job_id, task.search_id)
+                logger.warning(f"Error searching for '{task.keyword}': {error}")
+
+            scheduler = SearchScheduler(lambda params: google_get("nearbysearch", params, metrics), on_results, on_error)
+            root_cell = tiling.Cell(latitude, longitude, radius)
+            if saved_searches:
+                for saved in saved_searches:
+                    add_search(saved["keyword"], tiling.Cell(*saved["cell"]), saved)
+            else:
+                for keyword in keywords:
+                    add_search(keyword, root_cell)
+            # Results that were found but not enriched before the job stopped
+            for item in pending:
+                enrich(item["result"], item["keyword"], item["pending_id"])
+            # Keywords (and tiles) paginate independently, so run them side by side under one global cap
+            scheduler.run(max_workers=KEYWORD_CONCURRENCY)
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                counts[futures[future]]["enriched"] += 1
+                on_progress("enriching", tasks, counts, done, len(futures))
+
+        # Keep output in keyword and search order regardless of which lookups finished first
+        results_by_keyword = {keyword: [] for keyword in keywords}
+        for future, keyword in futures.items():
+            if future.exception() is None:
+                results_by_keyword[keyword].append(future.result())
+        all_results = [row for keyword in keywords for row in results_by_keyword[keyword]]
+
+        on_progress("finished", tasks, counts, len(futures), len(futures))
+        lead_jobs.record_api_calls(job_id, metrics.keyword_requests)
+        return job_id, all_results, counts, lead_jobs.finish_job(job_id), metrics
+    finally:
+        metrics.resources.stop()
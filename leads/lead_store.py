@@ -0,0 +1,429 @@
+# TeamWork leads/lead_store.py
+import sqlite3
+import ast
+import json
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+LEADS_DB = os.environ.get("LEADS_DB", os.path.join(os.path.dirname(__file__), "data/leads.db"))
+
+# Display column -> leads table column, in the order rows are produced by generate_leads
+LEAD_COLUMNS = {
+    "Name": "name",
+    "Address": "address",
+    "Types": "types",
+    "Website": "website",
+    "Email": "email",
+    "Phone Number": "phone_number",
+    "Rating": "rating",
+    "Business Type": "business_type",
+    "Keyword": "keyword",
+    "Place ID": "place_id",
+    "Latitude": "lat",
+    "Longitude": "lng",
+}
+KEY_COLUMN = "Lead Key"
+# Columns an editor may change from the grid; place_id and the coordinates come from Google and stay put
+EDITABLE_COLUMNS = [column for column in LEAD_COLUMNS.values() if column not in ("place_id", "lat", "lng")]
+# Typed schema for loaded leads: Types is a list, these few-valued columns are categorical, these are float
+CATEGORY_COLUMNS = ("Business Type", "Keyword")
+FLOAT_COLUMNS = ("Rating", "Latitude", "Longitude")
+TYPES_DTYPE = pd.ArrowDtype(pa.list_(pa.string()))
+# Columns matched by the Leads List search box
+SEARCH_COLUMNS = ("name", "address", "website", "email", "phone_number", "keyword")
+
+@contextmanager
+def get_db_connection(db_path=LEADS_DB):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def init_db(db_path=LEADS_DB):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    with get_db_connection(db_path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''CREATE TABLE IF NOT EXISTS known_places
+                        (place_id TEXT PRIMARY KEY, last_enriched REAL)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS leads
+                        (lead_key TEXT PRIMARY KEY, place_id TEXT, name TEXT, address TEXT, types TEXT,
+                         website TEXT, email TEXT, phone_number TEXT, rating REAL, business_type TEXT,
+                         keyword TEXT, updated_at REAL)''')
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(leads)")]
+        # Columns added after the first stores were created
+        for column, column_type in (("job_id", "INTEGER"), ("lat", "REAL"), ("lng", "REAL"), ("merged_into", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE leads ADD COLUMN {column} {column_type}")
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_place_id ON leads (place_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_keyword ON leads (keyword)")
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_name ON leads (name)")
+        conn.execute("CREATE INDEX IF NOT EXISTS leads_job_id ON leads (job_id)")
+        conn.execute('''CREATE TABLE IF NOT EXISTS meta
+                        (key TEXT PRIMARY KEY, value TEXT)''')
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+        # Tells snapshots of a deleted and recreated store apart from ones of this store
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+        # Every cell saved from the grid, with the value the editor started from
+        conn.execute('''CREATE TABLE IF NOT EXISTS lead_edits
+                        (edit_id INTEGER PRIMARY KEY AUTOINCREMENT, lead_key TEXT, column_name TEXT,
+                         old_value TEXT, new_value TEXT, editor TEXT, edited_at REAL)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS lead_edits_lead_key ON lead_edits (lead_key)")
+        # Merged duplicates stay in leads, hidden behind merged_into, so every merge can be undone
+        conn.execute('''CREATE TABLE IF NOT EXISTS lead_merges
+                        (merge_id INTEGER PRIMARY KEY AUTOINCREMENT, survivor_key TEXT, merged_keys TEXT,
+                         merged_at REAL, undone_at REAL)''')
+        conn.commit()
+
+def bump_version(conn):
+    # Called inside every write transaction so readers can cache by version
+    conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+def get_store_tag(db_path=LEADS_DB):
+    """The store's id and data version, e.g. for naming files derived from the current leads."""
+    with get_db_connection(db_path) as conn:
+        return _snapshot_tag(conn).decode()
+
+def get_data_version(db_path=LEADS_DB):
+    """Changes whenever the leads table does; cheap enough to call on every rerun."""
+    with get_db_connection(db_path) as conn:
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+def make_lead_key(place_id, name, address):
+    # Leads imported from the old CSV have no place_id, so fall back to name + address
+    return place_id or f"{name}|{address}"
+
+def encode_types(types):
+    if isinstance(types, str):
+        try:
+            types = ast.literal_eval(types)
+        except (ValueError, SyntaxError):
+            types = [t.strip() for t in types.split(",") if t.strip()]
+    if types is None or (isinstance(types, float) and pd.isna(types)):
+        types = []
+    return json.dumps(list(types))
+
+def _to_float(value):
+    # Grid edits come back as text and old CSV rows have blanks
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(value) else value
+
+def _to_record(row):
+    record = dict(zip(LEAD_COLUMNS.values(), row))
+    record.setdefault("place_id", None)
+    for column in ("name", "address", "website", "email", "phone_number", "business_type", "keyword", "place_id"):
+        if record[column] is None or (isinstance(record[column], float) and pd.isna(record[column])):
+            record[column] = ""
+    record["place_id"] = record["place_id"] or None
+    record["types"] = encode_types(record["types"])
+    for column in ("rating", "lat", "lng"):
+        record[column] = _to_float(record.get(column))
+    record["lead_key"] = make_lead_key(record["place_id"], record["name"], record["address"])
+    return record
+
+def _refresh_update(column):
+    # A refresh fills in and updates a lead, but never blanks a value Google stopped returning
+    # and never overwrites a cell someone corrected by hand
+    if column == "keyword":
+        # A lead stays under the keyword that found it first
+        return "keyword = COALESCE(NULLIF(keyword, ''), excluded.keyword)"
+    value = f"COALESCE(NULLIF(NULLIF(excluded.{column}, ''), '[]'), {column})"
+    if column in EDITABLE_COLUMNS:
+        value = (f"CASE WHEN EXISTS (SELECT 1 FROM lead_edits e WHERE e.lead_key = leads.lead_key "
+                 f"AND e.column_name = '{column}') THEN {column} ELSE {value} END")
+    return f"{column} = {value}"
+
+def write_leads(conn, rows, job_id=None):
+    """Upsert leads on an open connection without committing, so callers can add to the transaction.
+
+    Known leads keep their keyword, their hand-edited cells and any value the new row leaves empty.
+    """
+    now = time.time()
+    records = [_to_record(row) for row in rows]
+    columns = ["lead_key"] + list(LEAD_COLUMNS.values()) + ["job_id", "updated_at"]
+    updates = ", ".join([_refresh_update(column) for column in LEAD_COLUMNS.values()] +
+                        ["job_id = excluded.job_id", "updated_at = excluded.updated_at"])
+    conn.executemany(
+        f"INSERT INTO leads ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT(lead_key) DO UPDATE SET {updates}",
+        [[record[column] for column in columns[:-2]] + [job_id, now] for record in records]
+    )
+    conn.executemany("INSERT OR REPLACE INTO known_places (place_id, last_enriched) VALUES (?, ?)",
+                     [(record["place_id"], now) for record in records if record["place_id"]])
+    bump_version(conn)
+    return len(records)
+
+def add_leads(rows, db_path=LEADS_DB, job_id=None):
+    """Insert or update leads (sequences in LEAD_COLUMNS order) and mark their places as enriched."""
+    with get_db_connection(db_path) as conn:
+        count = write_leads(conn, rows, job_id)
+        conn.commit()
+    return count
+
+def _encode_frame(data):
+    # Grid rows in their stored form, indexed by lead key, so cells compare the way SQLite will see them
+    records = [_to_record([row.get(name) for name in LEAD_COLUMNS]) for row in data.to_dict("records")]
+    return pd.DataFrame(records, index=data[KEY_COLUMN].tolist(), columns=EDITABLE_COLUMNS, dtype=object)
+
+def _same(a, b):
+    return a == b or (pd.isna(a) and pd.isna(b))
+
+def diff_leads(original, edited):
+    """The cells an editor changed, matched on the lead key: [{lead_key, column, old, new}]."""
+    before = _encode_frame(original)
+    after = _encode_frame(edited)
+    keys = before.index.intersection(after.index)
+    before, after = before.loc[keys], after.loc[keys]
+    changed = before.ne(after) & ~(before.isna() & after.isna())
+    changed = changed.stack()
+    return [
+        {"lead_key": key, "column": column, "old": before.at[key, column], "new": after.at[key, column]}
+        for key, column in changed[changed].index
+    ]
+
+def apply_edits(edits, editor="", db_path=LEADS_DB):
+    """Save diff_leads() edits as per-cell updates and record them in the edit journal.
+
+    An edit only lands if the cell still holds the value the editor started from; otherwise
+    someone else saved it first and the edit is returned as a conflict instead of overwriting
+    theirs. Returns (cells saved, conflicts).
+    """
+    edits = [edit for edit in edits if edit["column"] in EDITABLE_COLUMNS]
+    if not edits:
+        return 0, []
+    now = time.time()
+    keys = list({edit["lead_key"] for edit in edits})
+    with get_db_connection(db_path) as conn:
+        # Take the write lock before reading so nobody can save between the check and the update
+        conn.execute("BEGIN IMMEDIATE")
+        current = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(f"SELECT lead_key, {', '.join(EDITABLE_COLUMNS)} FROM leads "
+                                f"WHERE lead_key IN ({','.join('?' * len(chunk))})", chunk)
+            current.update((row[0], dict(zip(EDITABLE_COLUMNS, row[1:]))) for row in rows)
+
+        applied = []
+        conflicts = []
+        for edit in edits:
+            stored = current.get(edit["lead_key"])
+            if stored is None:
+                conflicts.append(dict(edit, current=None))
+            elif _same(stored[edit["column"]], edit["old"]):
+                applied.append(edit)
+            elif not _same(stored[edit["column"]], edit["new"]):
+                conflicts.append(dict(edit, current=stored[edit["column"]]))
+
+        for column in {edit["column"] for edit in applied}:
+            conn.executemany(f"UPDATE leads SET {column} = ?, updated_at = ? WHERE lead_key = ?",
+                             [(edit["new"], now, edit["lead_key"]) for edit in applied if edit["column"] == column])
+        conn.executemany(
+            "INSERT INTO lead_edits (lead_key, column_name, old_value, new_value, editor, edited_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(edit["lead_key"], edit["column"], edit["old"], edit["new"], editor, now) for edit in applied]
+        )
+        if applied:
+            bump_version(conn)
+        conn.commit()
+    return len(applied), conflicts
+
+def snapshot_path(db_path=LEADS_DB):
+    return os.path.splitext(db_path)[0] + ".arrow"
+
+def _snapshot_tag(conn):
+    meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'version')").fetchall())
+    return f"{meta['store_id']}:{meta['version']}".encode()
+
+def _read_snapshot(path, tag):
+    if not os.path.exists(path):
+        return None
+    table = feather.read_table(path, memory_map=True)
+    if (table.schema.metadata or {}).get(b"snapshot_tag") != tag:
+        return None
+    # Types stays an Arrow list column instead of becoming a Python list per row
+    return table.to_pandas(types_mapper=lambda arrow_type: TYPES_DTYPE if arrow_type == TYPES_DTYPE.pyarrow_dtype else None)
+
+def _write_snapshot(data, path, tag):
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, snapshot_tag=tag))
+    # Written aside and swapped in, so readers never see half a file; each writer gets its own
+    # temporary file, since several sessions may rebuild the snapshot at once
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(descriptor)
+    try:
+        feather.write_feather(table, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def load_leads(db_path=LEADS_DB, keyword=None):
+    """Every lead (or one keyword's) as a typed frame.
+
+    The full table is served from an Arrow snapshot of the current data version, which loads
+    without any per-row decoding; the snapshot is rebuilt from SQLite after the leads change.
+    """
+    query = f"SELECT {', '.join(LEAD_COLUMNS.values())}, lead_key FROM leads WHERE merged_into IS NULL"
+    params = []
+    if keyword:
+        query += " AND keyword = ?"
+        params.append(keyword)
+    with get_db_connection(db_path) as conn:
+        # One read transaction, so the rows are exactly the version the snapshot gets tagged with
+        conn.execute("BEGIN")
+        tag = _snapshot_tag(conn) if keyword is None else None
+        if tag is not None:
+            data = _read_snapshot(snapshot_path(db_path), tag)
+            if data is not None:
+                return data
+        data = _decode_frame(pd.read_sql_query(query + " ORDER BY rowid", conn, params=params))
+    if tag is not None:
+        _write_snapshot(data, snapshot_path(db_path), tag)
+    return data
+
+def _decode_frame(data):
+    data.columns = list(LEAD_COLUMNS) + [KEY_COLUMN]
+    data["Types"] = pd.Series(pd.array(data["Types"].map(json.loads), dtype=TYPES_DTYPE), index=data.index)
+    for column in CATEGORY_COLUMNS:
+        data[column] = data[column].astype("category")
+    for column in FLOAT_COLUMNS:
+        data[column] = data[column].astype("float64")
+    return data
+
+def _lead_filter(search=None, keyword=None, job_id=None):
+    """(WHERE clause, params) selecting the visible leads that match the filters."""
+    where = ["merged_into IS NULL"]
+    params = []
+    if search:
+        where.append("(" + " OR ".join(f"{column} LIKE ?" for column in SEARCH_COLUMNS) + ")")
+        params.extend([f"%{search}%"] * len(SEARCH_COLUMNS))
+    if keyword:
+        where.append("keyword = ?")
+        params.append(keyword)
+    if job_id is not None:
+        where.append("job_id = ?")
+        params.append(job_id)
+    return f" WHERE {' AND '.join(where)}", params
+
+def _lead_order(sort_by=None, descending=False):
+    # Only sort on known columns; the name is interpolated into the SQL
+    if sort_by in LEAD_COLUMNS:
+        return f"{LEAD_COLUMNS[sort_by]} {'DESC' if descending else 'ASC'}, rowid"
+    return "rowid"
+
+def query_leads(search=None, keyword=None, sort_by=None, descending=False, limit=50, offset=0, db_path=LEADS_DB, job_id=None):
+    """Return (one page of leads, total matching rows), filtered and sorted in SQLite."""
+    where_sql, params = _lead_filter(search, keyword, job_id)
+    with get_db_connection(db_path) as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM leads{where_sql}", params).fetchone()[0]
+        data = pd.read_sql_query(
+            f"SELECT {', '.join(LEAD_COLUMNS.values())}, lead_key FROM leads{where_sql} ORDER BY {_lead_order(sort_by, descending)} LIMIT ? OFFSET ?",
+            conn, params=params + [limit, offset]
+        )
+    return _decode_frame(data), total
+
+def iter_leads(search=None, keyword=None, sort_by=None, descending=False, chunk_size=20000, db_path=LEADS_DB, job_id=None):
+    """Yield the matching leads as typed frames of up to chunk_size rows, all from one read transaction."""
+    where_sql, params = _lead_filter(search, keyword, job_id)
+    with get_db_connection(db_path) as conn:
+        conn.execute("BEGIN")
+        yield from map(_decode_frame, pd.read_sql_query(
+            f"SELECT {', '.join(LEAD_COLUMNS.values())}, lead_key FROM leads{where_sql} ORDER BY {_lead_order(sort_by, descending)}",
+            conn, params=params, chunksize=chunk_size
+        ))
+
+def list_keywords(db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT keyword FROM leads WHERE keyword != '' AND merged_into IS NULL ORDER BY keyword")]
+
+def count_leads(db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM leads WHERE merged_into IS NULL").fetchone()[0]
+
+def import_csv(csv_path, db_path=LEADS_DB):
+    """One-time import of the old compiled CSV; returns the number of leads added. Rows already in the store are left untouched."""
+    if not os.path.exists(csv_path):
+        return 0
+    with get_db_connection(db_path) as conn:
+        if conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone():
+            return 0
+    data = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    records = [_to_record([row.get(name, "") for name in LEAD_COLUMNS]) for row in data.to_dict("records")]
+    columns = ["lead_key"] + list(LEAD_COLUMNS.values()) + ["updated_at"]
+    now = time.time()
+    with get_db_connection(db_path) as conn:
+        before = conn.total_changes
+        conn.executemany(
+            f"INSERT OR IGNORE INTO leads ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [[record[column] for column in columns[:-1]] + [now] for record in records]
+        )
+        # Rows whose lead key was already taken (repeats in the CSV, or leads already stored) are ignored
+        imported = conn.total_changes - before
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_imported', ?)", (csv_path,))
+        bump_version(conn)
+        conn.commit()
+    return imported
+
+def merge_leads(groups, db_path=LEADS_DB):
+    """Hide each group's duplicates behind its survivor. groups is [(survivor key, [duplicate keys])]."""
+    now = time.time()
+    with get_db_connection(db_path) as conn:
+        for survivor_key, merged_keys in groups:
+            conn.executemany("UPDATE leads SET merged_into = ? WHERE lead_key = ? AND merged_into IS NULL",
+                             [(survivor_key, key) for key in merged_keys])
+            conn.execute("INSERT INTO lead_merges (survivor_key, merged_keys, merged_at) VALUES (?, ?, ?)",
+                         (survivor_key, json.dumps(merged_keys), now))
+        bump_version(conn)
+        conn.commit()
+    return sum(len(merged_keys) for _, merged_keys in groups)
+
+def undo_merge(merge_id, db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        row = conn.execute("SELECT survivor_key, merged_keys FROM lead_merges WHERE merge_id = ? AND undone_at IS NULL",
+                           (merge_id,)).fetchone()
+        if row is None:
+            return 0
+        survivor_key, merged_keys = row[0], json.loads(row[1])
+        conn.executemany("UPDATE leads SET merged_into = NULL WHERE lead_key = ? AND merged_into = ?",
+                         [(key, survivor_key) for key in merged_keys])
+        conn.execute("UPDATE lead_merges SET undone_at = ? WHERE merge_id = ?", (time.time(), merge_id))
+        bump_version(conn)
+        conn.commit()
+    return len(merged_keys)
+
+def list_merges(limit=50, db_path=LEADS_DB):
+    with get_db_connection(db_path) as conn:
+        data = pd.read_sql_query(
+            '''SELECT m.merge_id AS "Merge", COALESCE(l.name, m.survivor_key) AS "Kept", m.merged_keys AS "Merged",
+                      datetime(m.merged_at, 'unixepoch', 'localtime') AS "Merged At"
+               FROM lead_merges m LEFT JOIN leads l ON l.lead_key = m.survivor_key
+               WHERE m.undone_at IS NULL ORDER BY m.merge_id DESC LIMIT ?''',
+            conn, params=[limit]
+        )
+    data["Merged"] = data["Merged"].map(lambda keys: len(json.loads(keys)))
+    return data
+
+def get_known_places(place_ids, db_path=LEADS_DB):
+    """Return {place_id: last_enriched timestamp} for the place_ids we've already enriched."""
+    place_ids = list(place_ids)
+    known = {}
+    with get_db_connection(db_path) as conn:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(place_ids), 500):
+            chunk = place_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT place_id, last_enriched FROM known_places WHERE place_id IN ({placeholders})", chunk)
+            known.update(rows)
+    return known
+
+init_db()
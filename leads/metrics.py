@@ -0,0 +1,154 @@
+# TeamWork leads/metrics.py
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+import psutil
+from timing_utils import percentile
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+MAX_SAMPLES = 5000  # Per stage, for percentiles
+
+class ResourceSampler:
+    """Samples CPU and RAM on a background thread so the pipeline never has to."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.cpu_percent = 0.0
+        self.memory_percent = 0.0
+        self.peak_cpu_percent = 0.0
+        self.peak_memory_percent = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            psutil.cpu_percent()  # The first reading is always 0.0
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.cpu_percent = psutil.cpu_percent()
+            self.memory_percent = psutil.virtual_memory().percent
+            self.peak_cpu_percent = max(self.peak_cpu_percent, self.cpu_percent)
+            self.peak_memory_percent = max(self.peak_memory_percent, self.memory_percent)
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.wait_seconds = 0.0  # Queued for a rate limiter or concurrency cap; not in the latencies
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = deque(maxlen=MAX_SAMPLES)
+
+    def percentile(self, fraction):
+        return percentile(self.samples, fraction)
+
+class PipelineMetrics:
+    """Per-stage call counts, request counts and latency histograms for a lead run, plus the
+    network requests made on behalf of each keyword and CPU/RAM while it ran."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Started and stopped by the run, so one job finishing never stops another's sampling
+        self.resources = ResourceSampler()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.keyword_requests = Counter()
+            self.started = time.time()
+
+    def _stage(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = StageStats()
+        return self.stages[stage]
+
+    def count_call(self, stage):
+        with self._lock:
+            self._stage(stage).calls += 1
+
+    def record(self, stage, seconds, error=False, keyword=None):
+        with self._lock:
+            if keyword is not None:
+                self.keyword_requests[keyword] += 1
+            stats = self._stage(stage)
+            stats.requests += 1
+            stats.errors += error
+            stats.total_seconds += seconds
+            stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.samples.append(seconds)
+
+    def record_wait(self, stage, seconds):
+        with self._lock:
+            self._stage(stage).wait_seconds += seconds
+
+    @contextmanager
+    def timed(self, stage, keyword=None):
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - started, error, keyword)
+
+    def snapshot(self):
+        """Plain-data copy of every stage, e.g. to hand back from a worker process."""
+        with self._lock:
+            return {
+                stage: {"calls": stats.calls, "requests": stats.requests, "errors": stats.errors,
+                        "total_seconds": stats.total_seconds, "wait_seconds": stats.wait_seconds, "buckets": list(stats.buckets), "samples": list(stats.samples)}
+                for stage, stats in self.stages.items()
+            }
+
+    def merge(self, snapshot):
+        """Add another run's snapshot() into these stats."""
+        with self._lock:
+            for stage, data in snapshot.items():
+                stats = self._stage(stage)
+                stats.calls += data["calls"]
+                stats.requests += data["requests"]
+                stats.errors += data["errors"]
+                stats.total_seconds += data["total_seconds"]
+                stats.wait_seconds += data["wait_seconds"]
+                stats.buckets = [a + b for a, b in zip(stats.buckets, data["buckets"])]
+                stats.samples.extend(data["samples"])
+
+    def summary(self):
+        """One row per stage: calls, network requests, errors, latency percentiles in ms and seconds spent queued."""
+        rows = []
+        with self._lock:
+            for stage, stats in self.stages.items():
+                p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+                rows.append({
+                    "Stage": stage,
+                    "Calls": stats.calls,
+                    "Requests": stats.requests,
+                    "Errors": stats.errors,
+                    "p50 ms": round(p50 * 1000) if p50 is not None else None,
+                    "p95 ms": round(p95 * 1000) if p95 is not None else None,
+                    "Total s": round(stats.total_seconds, 1),
+                    "Wait s": round(stats.wait_seconds, 1),
+                })
+        return rows
+
+    def histogram(self, stage):
+        """{bucket label: count} for a stage's latencies."""
+        with self._lock:
+            buckets = list(self.stages[stage].buckets) if stage in self.stages else [0] * (len(LATENCY_BUCKETS) + 1)
+        labels = [f"≤{bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        return dict(zip(labels, buckets))
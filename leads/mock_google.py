@@ -0,0 +1,340 @@
+# TeamWork leads/mock_google.py
+# A local stand-in for Google Places, Custom Search, Nominatim and business websites, so the
+# lead pipeline can be run, measured and regression-tested without API keys:
+#   python leads/mock_google.py --port 8765 --latency-scale 2 --error-rate 0.05
+# then point the pipeline at it with the environment variables it prints.
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Server options and their defaults
+MOCK_DEFAULTS = {
+    "places_per_search": 60,   # Results a search has in total; Google stops at 60
+    "page_size": 20,
+    "token_delay": 1.0,        # Seconds before a next_page_token works; earlier use gets INVALID_REQUEST
+    "latency_scale": 1.0,      # Multiplies every entry of LATENCIES
+    "jitter": 0.5,             # Latencies vary by up to this fraction either way
+    "error_rate": 0.0,         # Fraction of Google requests that fail with one of ERROR_KINDS
+    "site_error_rate": 0.0,    # Fraction of website pages that fail with a 500
+    "shared_places": 0.2,      # Fraction of a search's results that other keywords find too
+    "website_rate": 0.7,       # Fraction of places whose Details have a website
+    "snippet_email_rate": 0.1, # Fraction of Custom Search results with an email in the snippet
+    "seed": 0,
+}
+
+# Typical seconds per request, before latency_scale and jitter
+LATENCIES = {
+    "nearbysearch": 0.15,
+    "findplacefromtext": 0.08,
+    "details": 0.08,
+    "customsearch": 0.2,
+    "nominatim": 0.1,
+    "site": 0.05,
+}
+
+# How an injected failure looks: an HTTP status, or Google's in-body status
+ERROR_KINDS = ("http_500", "http_429", "over_query_limit")
+
+# Website fixtures: where, if anywhere, the email can be found
+SITE_KINDS = ("mailto", "contact_page", "obfuscated", "cfemail", "none")
+
+NAME_PREFIXES = ("Summit", "Riverside", "Keystone", "Liberty", "Golden", "Allegheny", "Main Street", "Precision",
+                 "Family", "Ironworks", "Bluebird", "Three Rivers", "Heritage", "Northside", "Oakmont", "Pioneer")
+NAME_SUFFIXES = ("Co", "Services", "Group", "& Sons", "Pros", "Shop", "Studio", "Works")
+STREETS = ("Main St", "Liberty Ave", "Penn Ave", "Forbes Ave", "Carson St", "Butler St", "Grant St", "Smithfield St")
+
+def _digest(*parts):
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+def _encode_token(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+def _decode_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        return None
+
+def _cfemail(email, key=0x5a):
+    return f"{key:02x}" + "".join(f"{ord(char) ^ key:02x}" for char in email)
+
+class MockGoogle:
+    """Deterministic fake places, their details and websites, plus request counts for benchmarks.
+
+    The same search always returns the same places, so runs can be compared.
+    """
+
+    def __init__(self, **options):
+        unknown = set(options) - set(MOCK_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown mock options: {', '.join(sorted(unknown))}")
+        self.options = dict(MOCK_DEFAULTS, **options)
+        self.base_url = ""
+        self.places = {}
+        self.place_ids_by_name = {}
+        self.requests = Counter()
+        self.errors = Counter()
+        self._random = random.Random(self.options["seed"])
+        self._lock = threading.Lock()
+
+    def place(self, place_id, lat, lng):
+        """The fake place behind a place_id; its name, phone and website depend only on the id."""
+        with self._lock:
+            if place_id in self.places:
+                return self.places[place_id]
+        rng = random.Random(place_id)
+        name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(('Plumbing', 'Electric', 'Bakery', 'Dental', 'Auto Repair', 'Landscaping'))} {rng.choice(NAME_SUFFIXES)} {place_id[-4:].upper()}"
+        slug = "".join(char for char in name.lower() if char.isalnum())
+        place = {
+            "place_id": place_id,
+            "name": name,
+            "vicinity": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, Pittsburgh",
+            "types": ["point_of_interest", "establishment"],
+            "geometry": {"location": {"lat": lat, "lng": lng}},
+            "formatted_phone_number": f"(412) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            "rating": round(rng.uniform(2.5, 5.0), 1),
+            "has_website": rng.random() < self.options["website_rate"],
+            "site_kind": rng.choice(SITE_KINDS),
+            "email": f"hello@{slug[:20]}.test",
+        }
+        with self._lock:
+            place = self.places.setdefault(place_id, place)
+            self.place_ids_by_name.setdefault(place["name"].lower(), place_id)
+        return place
+
+    def website(self, place):
+        return f"{self.base_url}/sites/{place['place_id']}/" if place["has_website"] else ""
+
+    def search_results(self, keyword, location, radius):
+        """Every result of a search, in page order."""
+        lat, lng = map(float, location.split(","))
+        spread = min(float(radius), 50000) / 111000
+        results = []
+        for index in range(self.options["places_per_search"]):
+            rng = random.Random(_digest(keyword, location, radius, index))
+            if rng.random() < self.options["shared_places"]:
+                place_id = "mock-shared-" + _digest(location, rng.randrange(self.options["places_per_search"]))[:12]
+            else:
+                place_id = "mock-" + _digest(keyword, location, radius, index)[:16]
+            rng = random.Random(place_id)
+            place = self.place(place_id, round(lat + rng.uniform(-spread, spread), 6), round(lng + rng.uniform(-spread, spread), 6))
+            results.append({key: place[key] for key in ("place_id", "name", "vicinity", "types", "geometry")})
+        return results
+
+    def nearbysearch(self, params):
+        page = 0
+        query = [params.get("keyword", ""), params.get("location", "0,0"), params.get("radius", "1000")]
+        if "pagetoken" in params:
+            token = _decode_token(params["pagetoken"])
+            if token is None or time.time() - token["issued"] < self.options["token_delay"]:
+                return {"status": "INVALID_REQUEST", "results": []}
+            page, query = token["page"], token["query"]
+        results = self.search_results(*query)
+        page_size = self.options["page_size"]
+        data = {"status": "OK" if results else "ZERO_RESULTS", "results": results[page * page_size:(page + 1) * page_size]}
+        if (page + 1) * page_size < len(results):
+            data["next_page_token"] = _encode_token({"page": page + 1, "query": query, "issued": time.time()})
+        return data
+
+    def findplacefromtext(self, params):
+        with self._lock:
+            place_id = self.place_ids_by_name.get(params.get("input", "").lower())
+        if place_id is None:
+            return {"status": "ZERO_RESULTS", "candidates": []}
+        return {"status": "OK", "candidates": [{"place_id": place_id}]}
+
+    def details(self, params):
+        with self._lock:
+            place = self.places.get(params.get("place_id", ""))
+        if place is None:
+            return {"status": "NOT_FOUND"}
+        result = {
+            "formatted_phone_number": place["formatted_phone_number"],
+            "rating": place["rating"],
+            "website": self.website(place),
+            "geometry": place["geometry"],
+        }
+        fields = params.get("fields")
+        if fields:
+            result = {field: value for field, value in result.items() if field in fields.split(",")}
+        return {"status": "OK", "result": {field: value for field, value in result.items() if value}}
+
+    def customsearch(self, params):
+        with self._lock:
+            place_id = self.place_ids_by_name.get(params.get("q", "").lower())
+            place = self.places.get(place_id)
+        if place is None or not place["has_website"]:
+            return {}  # Like Google, no "items" at all when nothing matches
+        snippet = f"{place['name']} serves the Pittsburgh area. Call {place['formatted_phone_number']}."
+        if random.Random(place["place_id"] + "cse").random() < self.options["snippet_email_rate"]:
+            snippet += f" Email {place['email']}"
+        return {"items": [{"title": place["name"], "link": self.website(place), "snippet": snippet}]}
+
+    def nominatim(self, params):
+        rng = random.Random(_digest(params.get("city", ""), params.get("state", "")))
+        return [{"lat": str(round(rng.uniform(30, 45), 6)), "lon": str(round(rng.uniform(-120, -75), 6))}]
+
+    def site_page(self, place_id, page):
+        """HTML for a business's homepage ("") or contact page, or None if there's no such page."""
+        with self._lock:
+            place = self.places.get(place_id)
+        if place is None or not place["has_website"] or page not in ("", "contact"):
+            return None
+        kind, email = place["site_kind"], place["email"]
+        user, domain = email.split("@")
+        if page == "contact":
+            body = f'<p>Write to us at <a href="mailto:{email}">{email}</a></p>' if kind == "contact_page" else "<p>Call us.</p>"
+        elif kind == "mailto":
+            body = f'<footer><a href="mailto:{email}">Email us</a></footer>'
+        elif kind == "obfuscated":
+            body = f"<footer>{user} [at] {domain.replace('.', ' [dot] ')}</footer>"
+        elif kind == "cfemail":
+            body = f'<footer><a href="/cdn-cgi/l/email-protection" class="__cf_email__" data-cfemail="{_cfemail(email)}">[email&#160;protected]</a></footer>'
+        else:
+            body = "<footer>Visit us in store.</footer>"
+        return (f"<html><head><title>{place['name']}</title><script>var tracker = 'noreply@analytics.test';</script></head>"
+                f'<body><h1>{place["name"]}</h1><nav><a href="/sites/{place_id}/contact">Contact</a></nav>{body}</body></html>')
+
+    def sleep(self, endpoint):
+        latency = LATENCIES[endpoint] * self.options["latency_scale"]
+        jitter = self.options["jitter"]
+        with self._lock:
+            factor = self._random.uniform(1 - jitter, 1 + jitter)
+        time.sleep(max(0.0, latency * factor))
+
+    def inject_error(self, rate):
+        """An ERROR_KINDS entry for this request, or None to let it through."""
+        with self._lock:
+            if self._random.random() >= rate:
+                return None
+            return self._random.choice(ERROR_KINDS)
+
+    def summary(self):
+        """Requests and injected errors per endpoint so far."""
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+ROUTES = {
+    "/place/nearbysearch/json": "nearbysearch",
+    "/place/findplacefromtext/json": "findplacefromtext",
+    "/place/details/json": "details",
+    "/customsearch/v1": "customsearch",
+    "/nominatim/search": "nominatim",
+}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = ROUTES.get(url.path)
+        if endpoint is None and url.path.startswith("/sites/"):
+            endpoint = "site"
+        with mock._lock:
+            mock.requests[endpoint or "unknown"] += 1
+        if endpoint is None:
+            self.reply(404, "text/plain", b"Not found")
+            return
+
+        mock.sleep(endpoint)
+        if endpoint == "site":
+            if mock.inject_error(mock.options["site_error_rate"]):
+                self.count_error(endpoint)
+                self.reply(500, "text/html", b"<h1>Internal Server Error</h1>")
+                return
+            _, _, place_id, page = (url.path.rstrip("/") + "/").split("/", 3)
+            html = mock.site_page(place_id, page.strip("/"))
+            if html is None:
+                self.reply(404, "text/html", b"<h1>Not found</h1>")
+            else:
+                self.reply(200, "text/html; charset=utf-8", html.encode())
+            return
+
+        error = mock.inject_error(mock.options["error_rate"]) if endpoint != "nominatim" else None
+        if error:
+            self.count_error(endpoint)
+        if error == "http_500":
+            self.reply(500, "application/json", b'{"error": "backend error"}')
+        elif error == "http_429":
+            self.reply(429, "application/json", b'{"error": "rate limited"}')
+        elif error == "over_query_limit":
+            self.reply_json({"status": "OVER_QUERY_LIMIT", "error_message": "You have exceeded your rate-limit for this API."})
+        else:
+            self.reply_json(getattr(mock, endpoint)(params))
+
+    def count_error(self, endpoint):
+        with self.server.mock._lock:
+            self.server.mock.errors[endpoint] += 1
+
+    def reply_json(self, data):
+        self.reply(200, "application/json", json.dumps(data).encode())
+
+    def reply(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown out everything else
+
+class MockGoogleServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        super().__init__((host, port), MockHandler)
+        self.mock = MockGoogle(**options)
+        self.mock.base_url = f"http://{host}:{self.server_address[1]}"
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return self.mock.base_url
+
+    def environ(self):
+        """Environment variables that point lead_pipeline at this server."""
+        return {
+            "PLACES_API_URL": f"{self.base_url}/place",
+            "CSE_API_URL": f"{self.base_url}/customsearch/v1",
+            "NOMINATIM_URL": f"{self.base_url}/nominatim/search",
+        }
+
+    def start(self):
+        """Serve on a background thread; returns self."""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-google", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fake Google Places, Custom Search and business websites.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for option, default in MOCK_DEFAULTS.items():
+        parser.add_argument(f"--{option.replace('_', '-')}", type=type(default), default=default)
+    args = vars(parser.parse_args(argv))
+    server = MockGoogleServer(args.pop("host"), args.pop("port"), **args)
+    for name, value in server.environ().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
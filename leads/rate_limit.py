@@ -0,0 +1,57 @@
+# TeamWork leads/rate_limit.py
+import threading
+import time
+from datetime import date
+
+class QuotaExceeded(Exception):
+    pass
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DailyQuota:
+    """Counts calls per calendar day and refuses them once `limit` is reached."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.day = date.today()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self):
+        with self._lock:
+            today = date.today()
+            if today != self.day:
+                self.day, self.used = today, 0
+            if self.limit is not None and self.used >= self.limit:
+                raise QuotaExceeded(f"Daily {self.name} quota of {self.limit} requests used up")
+            self.used += 1
+
+class RateLimiter:
+    def __init__(self, name, rate, capacity=None, daily_limit=None):
+        self.bucket = TokenBucket(rate, capacity)
+        self.quota = DailyQuota(name, daily_limit)
+
+    def acquire(self):
+        self.quota.consume()
+        self.bucket.acquire()
@@ -0,0 +1,109 @@
+# TeamWork leads/search_scheduler.py
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Google needs a moment before a next_page_token can be used
+PAGE_TOKEN_DELAY = 1.5
+MAX_TOKEN_RETRIES = 5
+
+class SearchTask:
+    def __init__(self, keyword, params, max_results):
+        self.keyword = keyword
+        self.params = params
+        self.max_results = max_results
+        self.results_written = 0
+        self.page_token = None
+        self.token_retries = 0
+        self.status = "queued"  # queued -> searching -> done | failed
+
+class SearchScheduler:
+    """Paginates nearbysearch for many keywords, working on other keywords while page tokens warm up.
+
+    fetch_page(params) returns the decoded nearbysearch response. on_results(task, results)
+    is called with each page (trimmed to the task's max_results), and on_error(task, error)
+    when a keyword has to be abandoned.
+    """
+
+    def __init__(self, fetch_page, on_results, on_error=None, token_delay=PAGE_TOKEN_DELAY, max_token_retries=MAX_TOKEN_RETRIES):
+        self.fetch_page = fetch_page
+        self.on_results = on_results
+        self.on_error = on_error
+        self.token_delay = token_delay
+        self.max_token_retries = max_token_retries
+        self._queue = []
+        self._order = itertools.count()
+
+    def add(self, keyword, params, max_results):
+        task = SearchTask(keyword, params, max_results)
+        self._schedule(task, time.monotonic())
+        return task
+
+    def _schedule(self, task, ready_at):
+        heapq.heappush(self._queue, (ready_at, next(self._order), task))
+
+    def run(self, max_workers=1):
+        """Fetch pages until every keyword is done, with up to max_workers requests in flight.
+
+        Callbacks always run on the calling thread.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            running = {}
+            while self._queue or running:
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now and len(running) < max_workers:
+                    _, _, task = heapq.heappop(self._queue)
+                    task.status = "searching"
+                    running[pool.submit(self.fetch_task, task)] = task
+
+                timeout = None
+                if self._queue and len(running) < max_workers:
+                    timeout = max(0, self._queue[0][0] - now)
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.handle_page(running.pop(future), future)
+                elif timeout:
+                    time.sleep(timeout)
+
+    def fetch_task(self, task):
+        params = dict(task.params)
+        if task.page_token:
+            params["pagetoken"] = task.page_token
+        return self.fetch_page(params)
+
+    def handle_page(self, task, future):
+        try:
+            data = future.result()
+        except Exception as e:
+            self.fail(task, e)
+            return
+
+        status = data.get("status", "OK")
+        if status == "INVALID_REQUEST" and task.page_token:
+            # The token isn't live yet; come back later instead of blocking every keyword
+            task.token_retries += 1
+            if task.token_retries <= self.max_token_retries:
+                self._schedule(task, time.monotonic() + self.token_delay * 2 ** (task.token_retries - 1))
+            else:
+                self.fail(task, Exception(f"next_page_token for '{task.keyword}' never became valid"))
+            return
+        if status not in ("OK", "ZERO_RESULTS"):
+            self.fail(task, Exception(data.get("error_message", status)))
+            return
+
+        results = data.get("results", [])[:task.max_results - task.results_written]
+        task.results_written += len(results)
+        task.token_retries = 0
+        task.page_token = data.get("next_page_token")
+        if task.page_token and task.results_written < task.max_results:
+            self._schedule(task, time.monotonic() + self.token_delay)
+        else:
+            task.status = "done"
+        self.on_results(task, results)
+
+    def fail(self, task, error):
+        task.status = "failed"
+        if self.on_error:
+            self.on_error(task, error)
@@ -0,0 +1,55 @@
+# TeamWork leads/tiling.py
+import math
+
+RESULT_CAP = 60          # nearbysearch never returns more than this for one query
+MIN_CELL_RADIUS = 250    # meters; cells this small aren't split any further
+MAX_DEPTH = 6            # hard stop on how many times a cell is split
+EARTH_RADIUS = 6371000   # meters
+
+class Cell:
+    def __init__(self, lat, lng, radius, depth=0):
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self.depth = depth
+
+    @property
+    def location(self):
+        return f"{self.lat:.6f},{self.lng:.6f}"
+
+    def can_split(self):
+        return self.depth < MAX_DEPTH and self.radius / math.sqrt(2) >= MIN_CELL_RADIUS
+
+    def split(self):
+        """Four circles that together cover this one.
+
+        The cell's bounding square is cut into quarters and each quarter gets the
+        circle that circumscribes it.
+        """
+        offset = self.radius / 2
+        child_radius = self.radius / math.sqrt(2)
+        dlat = math.degrees(offset / EARTH_RADIUS)
+        dlng = math.degrees(offset / (EARTH_RADIUS * math.cos(math.radians(self.lat))))
+        return [
+            Cell(self.lat + sign_lat * dlat, self.lng + sign_lng * dlng, child_radius, self.depth + 1)
+            for sign_lat in (1, -1)
+            for sign_lng in (1, -1)
+        ]
+
+def is_saturated(results_found):
+    return results_found >= RESULT_CAP
+
+def distance(lat1, lng1, lat2, lng2):
+    # Haversine distance in meters
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+def within(result, cell):
+    """True if a nearbysearch result lies inside the cell (results without a location are kept)."""
+    location = result.get("geometry", {}).get("location")
+    if not location:
+        return True
+    return distance(cell.lat, cell.lng, location["lat"], location["lng"]) <= cell.radius
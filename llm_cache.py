@@ -0,0 +1,112 @@
+# TeamWork llm_cache.py
+# Ollama responses kept on disk, keyed by what produced them: the model's digest, the prompt and
+# the generation options. No Streamlit here.
+import hashlib
+import json
+import os
+import threading
+import time
+from lru_store import LruStore
+from ollama_client import GenerationOptions, client
+
+CACHE_DB = os.environ.get("LLM_CACHE_DB", os.path.join(os.path.dirname(__file__), "data/llm_cache.db"))
+CACHE_MAX_BYTES = 100 * 1024 * 1024  # Least recently used responses are evicted past this size
+DIGEST_TTL = 60  # Seconds a model's digest is trusted before /api/tags is asked again; catches re-pulls
+
+def _normalize_options(options):
+    if isinstance(options, GenerationOptions):
+        options = options.to_ollama()
+    # 0 and 0.0 are the same temperature
+    return {name: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+            for name, value in sorted((options or {}).items()) if value is not None}
+
+def is_deterministic(options):
+    """Whether the same request gives the same answer, so it's worth caching by default: temperature 0."""
+    return _normalize_options(options).get("temperature") == 0.0
+
+class LlmCache:
+    def __init__(self, db_path=CACHE_DB, max_bytes=CACHE_MAX_BYTES, ollama=client):
+        self.store = LruStore(db_path, max_bytes, label_column="model")
+        self.ollama = ollama
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0  # Sampled calls that never looked at the cache
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._digests_at = 0.0
+
+    def model_digest(self, model):
+        with self._lock:
+            if model in self._digests and time.time() - self._digests_at <= DIGEST_TTL:
+                return self._digests[model]
+        # Asked outside the lock, so cache lookups for other models don't queue behind the request
+        models = self.ollama.request("GET", "tags").json()["models"]
+        digests = {entry["name"]: entry["digest"] for entry in models}
+        with self._lock:
+            self._digests, self._digests_at = digests, time.time()
+        # An unknown name gets pulled on first use; key on the name until then
+        return digests.get(model, model)
+
+    def make_key(self, model, prompt, system=None, images=None, context=None, options=None, format=None, **_):
+        raw = json.dumps([self.model_digest(model), system, prompt, images, context, format, _normalize_options(options)],
+                         sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def clear(self):
+        self.store.clear()
+        self.hits = self.misses = self.bypassed = 0
+
+    def summary(self):
+        entries, size = self.store.usage()
+        looked_up = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "hit_rate": self.hits / looked_up if looked_up else None, "entries": entries, "bytes": size}
+
+    def _lookup(self, model, prompt, cache, regenerate, kwargs):
+        """The cache key to store the answer under (None to not store it) and the cached answer, if any."""
+        if cache is None:
+            cache = is_deterministic(kwargs.get("options"))
+        if not cache:
+            with self._lock:
+                self.bypassed += 1
+            return None, None
+        key = self.make_key(model, prompt, **kwargs)
+        cached = None if regenerate else self.store.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, cached
+
+    def generate(self, model, prompt, cache=None, regenerate=False, **kwargs):
+        """client.generate(), answered from the cache when the same request was made before.
+
+        cache: None caches deterministic (temperature 0) requests only, True caches any request,
+        False skips the cache. regenerate=True asks Ollama again and replaces the cached answer.
+        Cached answers come back with "cached": True.
+        """
+        key, cached = self._lookup(model, prompt, cache, regenerate, kwargs)
+        if cached is not None:
+            return dict(cached, cached=True)
+        final = self.ollama.generate(model, prompt, **kwargs)
+        if key is not None:
+            self.store.set(key, model, final)
+        return final
+
+    def generate_stream(self, model, prompt, cache=None, regenerate=False, **kwargs):
+        """client.generate_stream() with generate()'s caching; a cached answer arrives as one message."""
+        key, cached = self._lookup(model, prompt, cache, regenerate, kwargs)
+        if cached is not None:
+            yield dict(cached, cached=True)
+            return
+        pieces = []
+        for part in self.ollama.generate_stream(model, prompt, **kwargs):
+            pieces.append(part.get("response", ""))
+            # Stored before the last message goes out: callers often stop reading at "done"
+            if part.get("done") and key is not None:
+                self.store.set(key, model, dict(part, response="".join(pieces)))
+            yield part
+
+# Shared by every page, like ollama_client.client
+llm_cache = LlmCache()
@@ -0,0 +1,121 @@
+# TeamWork lru_store.py
+# A size-capped key/value store in SQLite that evicts the least recently used entries first.
+# Backs both the Google API cache (leads/http_cache.py) and the Ollama response cache (llm_cache.py).
+import sqlite3
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+EVICT_TO = 0.9     # Eviction goes down to this fraction of max_bytes, so the next inserts don't all evict again
+TOUCH_BATCH = 100  # Reads whose last_access is written in one go
+
+class LruStore:
+    """JSON values by key, each tagged with a label (the endpoint or model that produced it).
+
+    The store's size is tracked as a running total, so an insert only scans the table when it may
+    have gone over max_bytes, and reads record their access time in batches instead of each writing.
+    """
+
+    def __init__(self, db_path, max_bytes, label_column="label"):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.label_column = label_column
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last read, not yet written
+        self.init_db()
+
+    @contextmanager
+    def get_db_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self.get_db_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f'''CREATE TABLE IF NOT EXISTS responses
+                             (key TEXT PRIMARY KEY, {self.label_column} TEXT, body TEXT, size INTEGER,
+                              created_at REAL, last_access REAL)''')
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            conn.commit()
+            # Other processes sharing the file add to it too; evict() recounts before deleting anything
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key, max_age=None):
+        """The stored value, or None if there's none or it's older than max_age seconds (it's then dropped)."""
+        now = time.time()
+        with self.get_db_connection() as conn:
+            row = conn.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            body, created_at = row
+            if max_age is not None and now - created_at > max_age:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+        with self._lock:
+            self._touched[key] = now
+            flush = len(self._touched) >= TOUCH_BATCH
+        if flush:
+            self.flush()
+        return json.loads(body)
+
+    def flush(self):
+        """Write the access times of recent reads."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            with self.get_db_connection() as conn:
+                conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in touched.items()])
+                conn.commit()
+
+    def set(self, key, label, value):
+        body = json.dumps(value)
+        now = time.time()
+        with self.get_db_connection() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO responses (key, {self.label_column}, body, size, created_at, last_access) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (key, label, body, len(body), now, now))
+            conn.commit()
+        with self._lock:
+            # A replaced entry is counted twice until the next recount; that only makes eviction come early
+            self._total += len(body)
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        self.flush()  # So recent reads count as recent
+        target = self.max_bytes * EVICT_TO
+        with self.get_db_connection() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            # Drop least recently used entries until we're back under the limit
+            stale_keys = []
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    if total <= target:
+                        break
+                    stale_keys.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                conn.commit()
+        with self._lock:
+            self._total = total
+
+    def clear(self):
+        with self._lock:
+            self._touched = {}
+            self._total = 0
+        with self.get_db_connection() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def usage(self):
+        """(entries, bytes) currently stored."""
+        with self.get_db_connection() as conn:
+            return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
@@ -25,6 +25,7 @@ from check_domain import run_domain_checker
 from task_management import run_task_management
 from weekly_prompt import run_weekly_prompt  # Import the new function
 from agent_builder import run_agent_builder  # Import the new function
+from ollama_utils import show_ollama_stats
 
 custom_css = """
 <style>
@@ -156,6 +157,10 @@ def main():
         st.title("🗂️ Task Management")
         run_task_management()
 
+    # Drawn after the page so it includes the calls this run just made
+    with st.sidebar:
+        show_ollama_stats()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,244 @@
+# TeamWork ollama_client.py
+# The one way every page and script talks to Ollama: a pooled keep-alive session with timeouts,
+# retries and per-model latency/throughput stats. No Streamlit here, so headless scripts can use it.
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, replace
+from typing import Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from timing_utils import backoff_delay, percentile
+
+logger = logging.getLogger("ollama_client")
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+CONNECT_TIMEOUT = 5   # seconds
+READ_TIMEOUT = 300    # seconds of silence before giving up; a cold model load can take a while
+MAX_RETRIES = 3
+BACKOFF_BASE, BACKOFF_CAP = 0.5, 10.0  # seconds; a busy local server frees up sooner than a remote API
+POOL_SIZE = 16
+# How long Ollama keeps a model (and the KV cache of its last prompt) loaded after a call. Long enough
+# to span a batch of generations and a user reading the results, so the next call skips both the
+# model load and re-evaluating a shared system prompt. Per call, keep_alive= overrides it; 0 unloads.
+KEEP_ALIVE = "30m"
+# Generations the server runs at once per model; past this, requests just queue inside Ollama.
+# Set OLLAMA_NUM_PARALLEL to the server's own value of it.
+NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL") or 4)
+# Worth retrying: Ollama is loading a model, overloaded or restarting
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_SAMPLES = 1000  # Per model, for percentiles
+
+class OllamaError(Exception):
+    """Ollama answered, but with an error (bad model name, out of memory, ...)."""
+
+@dataclass(frozen=True)
+class GenerationOptions:
+    """Sampling and length settings, sent as Ollama's "options". None keeps the model's own default."""
+    num_predict: Optional[int] = None       # Most tokens to generate; the main lever on latency. -1 is unlimited
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    top_k: Optional[int] = None
+    num_ctx: Optional[int] = None           # Context window in tokens
+    repeat_penalty: Optional[float] = None
+    presence_penalty: Optional[float] = None
+    frequency_penalty: Optional[float] = None
+    seed: Optional[int] = None
+    stop: Optional[Tuple[str, ...]] = None
+
+    def with_changes(self, **changes):
+        return replace(self, **changes)
+
+    def to_ollama(self):
+        return {name: list(value) if name == "stop" else value for name, value in asdict(self).items() if value is not None}
+
+class ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.tokens = 0
+        self.eval_seconds = 0.0
+        self.prompt_tokens = 0         # Evaluated, i.e. not served from Ollama's prompt cache
+        self.prompt_eval_seconds = 0.0
+        self.latencies = deque(maxlen=MAX_SAMPLES)
+        self.first_token_latencies = deque(maxlen=MAX_SAMPLES)
+
+class OllamaClient:
+    def __init__(self, base_url=OLLAMA_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE, keep_alive=KEEP_ALIVE):
+        self.base_url = base_url.rstrip("/")
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _model_stats(self, model):
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def _record(self, model, **changes):
+        with self._lock:
+            stats = self._model_stats(model)
+            for name, value in changes.items():
+                if isinstance(getattr(stats, name), deque):
+                    getattr(stats, name).append(value)
+                else:
+                    setattr(stats, name, getattr(stats, name) + value)
+
+    def request(self, method, path, model=None, **kwargs):
+        """Send a request to /api/<path>, retrying connection failures and overload responses.
+
+        Errors Ollama reports in the body are raised as OllamaError.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}/api/{path}"
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Ollama unreachable ({e}); retrying")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    break
+                response.close()
+                logger.warning(f"Ollama returned {response.status_code} for {path}; retrying")
+            if model is not None:
+                self._record(model, retries=1)
+            time.sleep(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP))
+
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("error")
+            except ValueError:
+                message = None
+            if message:
+                raise OllamaError(message)
+            response.raise_for_status()
+        return response
+
+    def _payload(self, model, prompt, stream, system=None, images=None, context=None, options=None,
+                 keep_alive=None, format=None):
+        if isinstance(options, GenerationOptions):
+            options = options.to_ollama()
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        optional = {"system": system, "images": images, "context": context, "options": options or None,
+                    "keep_alive": self.keep_alive if keep_alive is None else keep_alive, "format": format}
+        payload.update({name: value for name, value in optional.items() if value is not None})
+        return payload
+
+    def _finish(self, model, started, first_token_at, final):
+        self._record(model, calls=1, latencies=time.perf_counter() - started,
+                     tokens=final.get("eval_count") or 0, eval_seconds=(final.get("eval_duration") or 0) / 1e9,
+                     prompt_tokens=final.get("prompt_eval_count") or 0,
+                     prompt_eval_seconds=(final.get("prompt_eval_duration") or 0) / 1e9)
+        if first_token_at is not None:
+            self._record(model, first_token_latencies=first_token_at - started)
+
+    def generate(self, model, prompt, **kwargs):
+        """Generate a whole response and return Ollama's final message: "response" holds the text,
+        alongside "context", "eval_count", "eval_duration" and the rest.
+
+        kwargs: system, images (base64 strings), context, options (GenerationOptions), keep_alive, format.
+        Put fixed instructions in system and what changes per call in prompt: the rendered text then
+        starts the same every time, and Ollama only evaluates the part after its cached prefix.
+        """
+        started = time.perf_counter()
+        try:
+            response = self.request("POST", "generate", model=model, json=self._payload(model, prompt, False, **kwargs))
+            final = response.json()
+            if "error" in final:
+                raise OllamaError(final["error"])
+        except Exception:
+            self._record(model, calls=1, errors=1)
+            raise
+        self._finish(model, started, None, final)
+        return final
+
+    def generate_stream(self, model, prompt, **kwargs):
+        """Yield Ollama's messages as they're generated; each has a "response" piece of the text,
+        and the last has "done": True and the timing/count fields. Takes generate()'s kwargs."""
+        started = time.perf_counter()
+        first_token_at = None
+        try:
+            with self.request("POST", "generate", model=model, stream=True,
+                              json=self._payload(model, prompt, True, **kwargs)) as response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    part = json.loads(line)
+                    if "error" in part:
+                        raise OllamaError(part["error"])
+                    if first_token_at is None and part.get("response"):
+                        first_token_at = time.perf_counter()
+                    if part.get("done"):
+                        # Recorded before handing it over: callers often stop reading at "done"
+                        self._finish(model, started, first_token_at, part)
+                        yield part
+                        return
+                    yield part
+        except GeneratorExit:
+            raise
+        except Exception:
+            self._record(model, calls=1, errors=1)
+            raise
+
+    def generate_batch(self, model, prompts, max_parallel=NUM_PARALLEL, **kwargs):
+        """Generate a response to each prompt, up to max_parallel at a time, and yield
+        (index, final message, error) as each one finishes; exactly one of the last two is None.
+
+        A failed generation doesn't stop the others. Takes generate()'s kwargs, shared by every prompt.
+        """
+        prompts = list(prompts)
+        if not prompts:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(max_parallel, len(prompts)))
+        try:
+            futures = {executor.submit(self.generate, model, prompt, **kwargs): index for index, prompt in enumerate(prompts)}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # A caller that stops early doesn't wait on generations nobody will read
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def list_models(self):
+        return [model["name"] for model in self.request("GET", "tags").json()["models"]]
+
+    def summary(self):
+        """One row per model: calls, errors, retries, latency percentiles, prompt evaluation and generation speed."""
+        rows = []
+        with self._lock:
+            for model, stats in self.stats.items():
+                p50, p95 = percentile(stats.latencies, 0.5), percentile(stats.latencies, 0.95)
+                first_token = percentile(stats.first_token_latencies, 0.5)
+                rows.append({
+                    "Model": model,
+                    "Calls": stats.calls,
+                    "Errors": stats.errors,
+                    "Retries": stats.retries,
+                    "p50 ms": round(p50 * 1000) if p50 is not None else None,
+                    "p95 ms": round(p95 * 1000) if p95 is not None else None,
+                    "First token p50 ms": round(first_token * 1000) if first_token is not None else None,
+                    "Prompt tokens/call": round(stats.prompt_tokens / stats.calls) if stats.calls else None,
+                    "Prompt eval ms/call": round(stats.prompt_eval_seconds * 1000 / stats.calls) if stats.calls else None,
+                    "Tokens/s": round(stats.tokens / stats.eval_seconds, 1) if stats.eval_seconds else None,
+                })
+        return rows
+
+# Shared by every caller in the process, so connections are set up once and reused
+client = OllamaClient()
@@ -1,65 +1,40 @@
 # TeamWork ollama_utils.py
 import requests
 import json
-import io
+import base64
 import time
 import streamlit as st
-import ollama
 from datetime import datetime
-
-OLLAMA_URL = "http://localhost:11434/api"
+from ollama_client import GenerationOptions, OllamaError, client
+from llm_cache import llm_cache
 
 @st.cache_data  # Cache the list of available models
 def get_available_models():
-    response = requests.get(f"{OLLAMA_URL}/tags")
-    response.raise_for_status()
-    models = [
-        model["name"]
-        for model in response.json()["models"]
-        if "embed" not in model["name"]
-    ]
-    return models
-
-def call_ollama_endpoint(model, prompt=None, image=None, temperature=0.5, max_tokens=150, presence_penalty=0.0, frequency_penalty=0.0, context=None):
-    payload = {
-        "model": model,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "presence_penalty": presence_penalty,
-        "frequency_penalty": frequency_penalty,
-        "context": context if context is not None else [],
-    }
-    if prompt:
-        payload["prompt"] = prompt
-    if image:
-        # Read image data into BytesIO
-        image_bytesio = io.BytesIO(image.read())
+    return [model for model in client.list_models() if "embed" not in model]
 
-        # Determine image format and filename
-        image_format = "image/jpeg" if image.type == "image/jpeg" else "image/png"
-        filename = "image.jpg" if image.type == "image/jpeg" else "image.png"
+def show_ollama_stats():
+    """Per-model calls, errors, latency, prompt evaluation and speed since the app started."""
+    summary = client.summary()
+    with st.expander("📈 Ollama Stats", expanded=False):
+        if summary:
+            st.dataframe(summary, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No Ollama calls yet.")
 
-        # Send image data using multipart/form-data
-        files = {"file": (filename, image_bytesio, image_format)}
-        response = requests.post(f"{OLLAMA_URL}/generate", data=payload, files=files, stream=True)
-    else:
-        response = requests.post(f"{OLLAMA_URL}/generate", json=payload, stream=True)
+def call_ollama_endpoint(model, prompt=None, image=None, temperature=0.5, max_tokens=150, presence_penalty=0.0, frequency_penalty=0.0, context=None, regenerate=False):
+    # Temperature 0 answers come from llm_cache when asked before; regenerate=True asks the model again
+    images = None
+    if image:
+        # Ollama takes images as base64 strings alongside the prompt
+        images = [base64.b64encode(image.read()).decode("ascii")]
     try:
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
+        options = GenerationOptions(num_predict=max_tokens, temperature=temperature,
+                                    presence_penalty=presence_penalty, frequency_penalty=frequency_penalty)
+        final = llm_cache.generate(model, prompt or "", regenerate=regenerate, images=images,
+                                   context=context if context is not None else [], options=options)
+    except (requests.exceptions.RequestException, OllamaError) as e:
         return f"An error occurred: {str(e)}", None, None, None  # Return None for eval_count and eval_duration
-
-    response_parts = []
-    eval_count = None
-    eval_duration = None
-    for line in response.iter_lines():
-        part = json.loads(line)
-        response_parts.append(part.get("response", ""))
-        if part.get("done", False):
-            eval_count = part.get("eval_count", None)
-            eval_duration = part.get("eval_duration", None)
-            break
-    return "".join(response_parts), part.get("context", None), eval_count, eval_duration
+    return final.get("response", ""), final.get("context"), final.get("eval_count"), final.get("eval_duration")
 
 def check_json_handling(model, temperature, max_tokens, presence_penalty, frequency_penalty):
     prompt = "Return the following data in JSON format: name: John, age: 30, city: New York"
@@ -77,8 +52,8 @@ def check_function_calling(model, temperature, max_tokens, presence_penalty, fre
 
 def pull_model(model_name):
     payload = {"name": model_name, "stream": True}
-    response = requests.post(f"{OLLAMA_URL}/pull", json=payload, stream=True)
-    response.raise_for_status()
+    # Downloads can go quiet for a long time between progress lines
+    response = client.request("POST", "pull", json=payload, stream=True, timeout=(client.timeout[0], None))
     progress_bar = st.progress(0)
     status_text = st.empty()
     results = []
@@ -106,13 +81,14 @@ def pull_model(model_name):
 
 def show_model_info(model_name):
     payload = {"name": model_name}
-    response = requests.post(f"{OLLAMA_URL}/show", json=payload)
-    response.raise_for_status()
-    return response.json()
+    return client.request("POST", "show", json=payload).json()
 
 def remove_model(model_name):
     payload = {"name": model_name}
-    response = requests.delete(f"{OLLAMA_URL}/delete", json=payload)
+    try:
+        response = client.request("DELETE", "delete", json=payload)
+    except (requests.exceptions.RequestException, OllamaError) as e:
+        return {"status": "error", "message": f"Failed to remove model '{model_name}': {e}"}
     if response.status_code == 200:
         try:
             return response.json()
@@ -21,7 +21,7 @@ from email.parser import BytesParser
 from email.policy import default
 import requests
 import PyPDF2
-from ollama_utils import get_available_models  # Import the function
+from ollama_utils import get_available_models, GenerationOptions, llm_cache  # Import the function
 
 # Load configuration
 @st.cache_resource
@@ -57,13 +57,13 @@ HEADER_TEMPLATE = os.path.join(os.path.dirname(__file__), 'header_long_story_sho
 
 # Ollama Setup
 default_model = 'mistral:instruct'
-ollama_url = 'http://localhost:11434/api/generate'
+GAP_REPORT_TOKENS = 2048  # Room for all nine sections, but a runaway generation still ends
 
 # Streamlit app
 st.title("Onboarding GAP Analysis Generator")
 
 # Workflow Execution
-def run_workflow(selected_model, temperature):
+def run_workflow(selected_model, temperature, regenerate=False):
     status_placeholder = st.empty()
     progress_bar = st.progress(0)
     
@@ -301,32 +301,21 @@ def run_workflow(selected_model, temperature):
             reader = PyPDF2.PdfReader(file)
             return '\n'.join([page.extract_text() for page in reader.pages])
 
-    def analyze_with_ollama(content, prompt_template, model=default_model, max_tokens=300):
+    def analyze_with_ollama(content, prompt_template, model=default_model, options=None):
         prompt = prompt_template.replace("{content}", content)
         
         def generate_response(prompt, context=[]):
-            data = {
-                'model': model,
-                'prompt': prompt,
-                'context': context,
-                'max_tokens': max_tokens
-            }
-            response = requests.post(ollama_url, json=data, stream=True)
-            response.raise_for_status()
             accumulated_response = ""
-            for line in response.iter_lines():
-                if line:
-                    body = json.loads(line)
-                    response_part = body.get('response', '')
-                    accumulated_response += response_part
-                    if len(accumulated_response) > 100:  # Yield only when accumulated response is sufficiently large
-                        yield accumulated_response
-                        accumulated_response = ""
-                    if body.get('done', False):
-                        yield accumulated_response  # Yield any remaining part when done
-                        break
-                    if 'error' in body:
-                        raise Exception(body['error'])
+            # A document that hasn't changed gets its earlier report back, unless asked to regenerate
+            for body in llm_cache.generate_stream(model, prompt, cache=True, regenerate=regenerate,
+                                                  context=context, options=options):
+                accumulated_response += body.get('response', '')
+                if len(accumulated_response) > 100:  # Yield only when accumulated response is sufficiently large
+                    yield accumulated_response
+                    accumulated_response = ""
+                if body.get('done', False):
+                    yield accumulated_response  # Yield any remaining part when done
+                    break
         
         return generate_response(prompt)
 
@@ -348,12 +337,11 @@ def run_workflow(selected_model, temperature):
             elif file.endswith('.pdf'):
                 content = read_pdf_document(file_path)
             
-            analysis_generator = analyze_with_ollama(content, prompt_template, model=selected_model, max_tokens=temperature)
+            analysis_generator = analyze_with_ollama(content, prompt_template, model=selected_model,
+                                                     options=GenerationOptions(temperature=temperature, num_predict=GAP_REPORT_TOKENS))
             
-            analysis_text = ""
-            st.write_stream(analysis_generator)
-            for part in analysis_generator:
-                analysis_text = part
+            # write_stream consumes the generator and returns the whole text
+            analysis_text = st.write_stream(analysis_generator)
             
             analysis_file_path = os.path.join(DOCS_FOLDER, f"{os.path.splitext(file)[0]}_GAP_analysis.txt")
             write_analysis_to_file(analysis_text, analysis_file_path)
@@ -383,9 +371,13 @@ def run_onboarding_workflow():
         available_models = get_available_models()
         selected_model = st.selectbox("Select Model for Analysis:", available_models, index=available_models.index(default_model), key="select_model")
         temperature = st.slider("Select Temperature for Analysis:", 0.0, 1.0, 0.2, 0.1, key="temperature_slider")
+        regenerate = st.checkbox("Regenerate reports for unchanged documents", value=False, key="regenerate_reports")
+        cache = llm_cache.summary()
+        st.caption(f"Response cache: {cache['hits']} hits, {cache['misses']} misses, {cache['entries']} stored "
+                   f"({cache['bytes'] / 1024 / 1024:.1f} MB)")
 
     if st.button("🏃‍♀️🏃‍♂️💨 Run Workflow", key="run_workflow"):
-        run_workflow(selected_model, temperature)
+        run_workflow(selected_model, temperature, regenerate)
         st.balloons()
 
     # Display Results
@@ -0,0 +1,14 @@
+# TeamWork timing_utils.py
+# Retry backoff and latency percentiles, shared by the Ollama client and the lead pipeline
+import random
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    # Exponential backoff with full jitter so parallel callers don't retry in lockstep
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def percentile(samples, fraction):
+    """The sample at fraction (0.95 for p95) of the way through, or None with no samples."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
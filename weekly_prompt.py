@@ -4,7 +4,6 @@ import pandas as pd
 import sqlite3
 from datetime import datetime
 from contextlib import contextmanager
-import ollama
 import time
 import re
 import os
@@ -12,13 +11,18 @@ import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import random
-from ollama_utils import get_available_models  # Import the function
+from ollama_utils import get_available_models, GenerationOptions, client as ollama_client, llm_cache  # Import the function
+from agent_prompt_guide import AGENT_PROMPT_SYSTEM
 import base64  # Import base64 for encoding
 
 # Email settings
 EMAIL_SUBJECT = "Prompt of the Week"
 UNSUBSCRIBE_LINK_TEMPLATE = "https://yourdomain.com/unsubscribe?email={email}"
 
+# Generation caps, in tokens
+PROMPT_TOKENS = 1024
+EMAIL_TOKENS = 768
+
 # Initialize session state variables
 def init_session_state():
     if 'prompts_df' not in st.session_state:
@@ -113,87 +117,41 @@ def generate_prompts(num_prompts=3, model_name='mistral:instruct', temperature=0
         """Create a scenario where a small business faces a sudden supply chain disruption. Outline steps they can take to mitigate the impact and maintain customer satisfaction."""
     ]
     
-    for _ in range(num_prompts):
-        try:
-            # Include temperature in the prompt string
-            prompt_with_temp = f"""You are an expert AI agent prompt engineer, specializing in generating unique and useful AI agent prompts for small business owners. 
-Your primary functions include content creation, brainstorming ideas, and testing scenarios to address specific business challenges with the prompts.
-The prompts should provide the AI agent they're for, the following information:
-When creating an AI agent prompt, several key elements need to be considered to ensure clarity, context, and effective guidance for the model. 
-
-Here is a comprehensive list of these elements:
-
-### Core Elements of AI Agent Prompt
-
-1. **Role Specification**:
-   - Clearly define the social or occupational role of the AI Agent, such as "You are a helpful assistant," "mentor," or "partner".
-   - Consider the relevance of the role to the task or query the AI Agent is expected to handle.
-2. **Purpose and Identity**:
-   - Articulate the core purpose and identity of the AI Agent, such as providing customer support, generating creative content, or assisting with technical queries.
-3. **Context and Background**:
-   - Provide detailed context for the task. For example, specify the type of content and the specific topic.
-   - Include any necessary background information or specifics upfront to inform the AI Agent.
-4. **Language and Tone**:
-   - Customize the language, tone, and behavioral traits to align with the agent’s role. For example, empathetic language for customer support or formal language for technical advice.
-   - Decide on the formality or casualness of the responses.
-5. **Structure and Clarity**:
-   - Use clear and specific language to outline the desired outcome, format, and style of the output.
-   - Employ markup and markdown to structure the prompt, such as headers and separators to distinguish instructions from context.
-6. **Examples and Pre-filled Responses**:
-   - Include examples in the prompt to illustrate the desired output format or style.
-   - Prefill responses with a few words to guide the output in the desired direction.
-7. **Iteration and Refinement**:
-   - Write, test, and refine the prompt iteratively based on the model's output. Slight changes in wording or structure can significantly impact responses.
-### Advanced Techniques
-1. **Visualization of Thought (VoT)**:
-   - Instruct the AI Agent to visualize its thought process step-by-step to clarify understanding and context.
-2. **Chain of Thought (CoT)**:
-   - Encourage step-by-step thinking to improve the quality of the output by breaking down complex tasks into smaller, manageable steps.
-3. **Tree of Thought (ToT)**:
-   - Provide a tree-structured process for problem-solving, ensuring all possible paths and decisions are considered.
-4. **Chain-of-Abstraction Reasoning**:
-   - Use abstract placeholders and then call domain-specific tools to fill in detailed knowledge, ensuring comprehensive and accurate responses.
-### Customization and Flexibility
-1. **Scenario-Based Instructions**:
-   - Include instructions for different scenarios that the AI Agent might encounter, preparing it to handle a wide range of interactions effectively.
-2. **Balance Specificity and Flexibility**:
-   - Provide specific instructions to guide behavior while allowing flexibility to handle unexpected situations gracefully.
-3. **Consistency and Documentation**:
-   - Ensure consistency in the use of formatting elements and thoroughly document prompt design choices, especially when collaborating or sharing prompts with others.
-### Practical Considerations
-1. **Markup and Special Characters**:
-   - Use minimal markup for structuring content, ensuring clarity and organization.
-
-Here's a random core concept for an agent prompt to guide you:
+    generation_prompts = [f"""Here's a random core concept for an agent prompt to guide you:
 
 {random.choice(example_prompts)}
 
-Now, generate a complete prompt for a different aspect of small business operations.
-?t={temperature}"""  
-
-            response = ollama.generate(
-                model=model_name,
-                prompt=prompt_with_temp # Use the modified prompt 
-            )
-            new_prompt = response['response'].strip()
-
-            if new_prompt not in st.session_state.used_prompts and new_prompt not in new_prompts:
-                new_prompts.append(new_prompt)
-                st.session_state.used_prompts.append(new_prompt)
-                save_prompt_to_db(new_prompt, 'review')
-        except Exception as e:
-            st.error(f"Error generating prompt: {e}")
+Now, generate a complete prompt for a different aspect of small business operations.""" for _ in range(num_prompts)]
+
+    # All the generations run at once; each is checked and saved as soon as it's back
+    for _, response, error in ollama_client.generate_batch(
+        model_name,
+        generation_prompts,
+        system=AGENT_PROMPT_SYSTEM,
+        options=GenerationOptions(temperature=temperature, num_predict=PROMPT_TOKENS),
+    ):
+        if error is not None:
+            st.error(f"Error generating prompt: {error}")
+            continue
+        new_prompt = response['response'].strip()
+
+        if new_prompt not in st.session_state.used_prompts and new_prompt not in new_prompts:
+            new_prompts.append(new_prompt)
+            st.session_state.used_prompts.append(new_prompt)
+            save_prompt_to_db(new_prompt, 'review')
     return new_prompts
 
 def log_step(step_description):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     st.session_state.workflow_log.append(f"{timestamp}: {step_description}")
 
-def generate_email_content(prompt, model_name='mistral:instruct', temperature=0.4):
-    """Generates email content to deliver the prompt of the week."""
+def generate_email_content(prompt, model_name='mistral:instruct', temperature=0.4, regenerate=False):
+    """Generates email content to deliver the prompt of the week.
+
+    The same prompt, model and temperature give back the cached email unless regenerate is set."""
     try:
         # Insert the prompt directly into the instructions with placeholders
-        prompt_with_temp = f"""You are an expert email marketer and your job is to create an email to deliver the 'Prompt of the Week' to small business owners. 
+        generation_prompt = f"""You are an expert email marketer and your job is to create an email to deliver the 'Prompt of the Week' to small business owners. 
 Here is the prompt for your own reference to inform your writing, but do not include it in the email yourself, it's only for your reference:
 {prompt}
 
@@ -208,12 +166,14 @@ Your task is to write the rest of the email, ensuring the content flows naturall
 5. Close with an encouragement to engage with the prompt and a brief sign-off.
 
 The email should be friendly, and encourage recipients to use the prompt. Do not use the prompt to generate content; instead, focus on delivering it directly as it is.
+"""
 
-?t={temperature}"""
-
-        response = ollama.generate(
+        response = llm_cache.generate(
             model=model_name,
-            prompt=prompt_with_temp  # Use the modified prompt
+            prompt=generation_prompt,
+            options=GenerationOptions(temperature=temperature, num_predict=EMAIL_TOKENS),
+            cache=True,
+            regenerate=regenerate,
         )
         email_content = response['response'].strip()
 
@@ -352,13 +312,15 @@ def run_weekly_prompt():
             index=available_models.index(st.session_state.selected_model_email) if st.session_state.selected_model_email in available_models else 0
         )
         temperature_email = st.sidebar.slider("Temperature for Email Content:", 0.0, 1.0, 0.2, 0.1)
+        regenerate_email = st.sidebar.checkbox("Regenerate email (ignore cached)", value=False)
 
         if selected_prompt and st.button("✉️ Generate Email Content"):
             st.session_state.selected_prompt = selected_prompt
             st.session_state.email_content = generate_email_content(
                 selected_prompt,
                 model_name=selected_model_email,
-                temperature=temperature_email
+                temperature=temperature_email,
+                regenerate=regenerate_email
             )
             log_step(f"Generated email content for prompt: {selected_prompt}")
 